@@ -11,7 +11,12 @@ a = Analysis(
     binaries=[],
     datas=[
         ('app.py', '.'), # Include app.py at the root of the packaged app
-        ('msg_converter_core.py', '.') # Include your core logic
+        ('msg_converter_core.py', '.'), # Include your core logic
+        ('conversion_cache.py', '.'), # Conversion cache used by app.py
+        ('conversion_metrics.py', '.'),
+        ('batch_convert.py', '.'), # Worker function for multi-file uploads in app.py
+        ('mbox_export.py', '.'), # Imported by batch_convert.py
+        ('conversion_guard.py', '.') # Watched worker pool and per-file limits
         # Add other data files if any (e.g., images, templates)
     ],
     hiddenimports=[
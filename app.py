@@ -1,21 +1,208 @@
 # app.py
+import time
+SCRIPT_STARTED = time.perf_counter()
 import streamlit as st
 import os
+import multiprocessing
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
 from io import BytesIO
 import msg_converter_core # Import our conversion logic
+import conversion_cache
+import conversion_guard
+import batch_convert # Worker function for multi-file conversion
+IMPORTS_DONE = time.perf_counter()
 
 st.set_page_config(page_title="MSG to EML Converter", layout="wide")
 
+def log_startup(message):
+    print(f"[startup] {message}", flush=True) # Goes to the server console / launcher window
+
+# Once per server process: import extract-msg (the slow part of the converter) on a background
+# thread, so the page is drawn without waiting for it
+@st.cache_resource
+def start_converter_prewarm():
+    return msg_converter_core.start_prewarm(log_callback=log_startup)
+
+@st.cache_resource
+def get_startup_state():
+    return {'first_render_reported': False}
+
+start_converter_prewarm()
+
 st.title("✉️ MSG to EML Converter (with Nested Attachments)")
 st.markdown("""
 Upload a `.msg` file. This tool will convert it into a single `.eml` file,
 with any nested `.msg` attachments also converted and embedded as `message/rfc822` parts
 (viewable as attached EMLs in most mail clients).
+Upload several files at once to convert them in parallel and download all EMLs as one ZIP archive.
 """)
 
-uploaded_file = st.file_uploader("Choose a .MSG file", type=["msg"])
+# One cache per server process, shared by all sessions and reruns. Set MSG2EML_CACHE_DIR to
+# also keep converted EMLs on disk between restarts.
+@st.cache_resource
+def get_conversion_cache():
+    return conversion_cache.ConversionCache(
+        max_memory_bytes=int(os.environ.get('MSG2EML_CACHE_MEMORY_MB', '128')) * 1024 * 1024,
+        disk_dir=os.environ.get('MSG2EML_CACHE_DIR') or None,
+        max_disk_bytes=int(os.environ.get('MSG2EML_CACHE_DISK_MB', '1024')) * 1024 * 1024
+    )
+
+# Per-file limits from MSG2EML_TIMEOUT_SECONDS, MSG2EML_MAX_MEMORY_MB, MSG2EML_MAX_ATTACHMENTS,
+# MSG2EML_MAX_ATTACHMENT_MB and MSG2EML_MAX_NESTING_DEPTH (all unset by default)
+conversion_limits = conversion_guard.limits_from_env()
+
+# Worker processes for multi-file uploads (and single ones when a time or memory limit is set),
+# shared by all sessions. MSG2EML_APP_WORKERS sets the pool size (defaults to the number of CPU
+# cores). Spawned rather than forked, since the Streamlit server process is multi-threaded. A worker
+# that goes over the limits, or crashes, is replaced without affecting the other conversions.
+@st.cache_resource
+def get_conversion_pool():
+    limits = conversion_limits or conversion_guard.ConversionLimits()
+    return conversion_guard.GuardedPool(
+        max_workers=int(os.environ.get('MSG2EML_APP_WORKERS', '0')) or None,
+        timeout=limits.timeout,
+        max_memory_bytes=limits.max_memory_bytes,
+        recycle_if=batch_convert.hit_memory_limit,
+        initializer=msg_converter_core.prewarm,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+def submit_conversion(msg_path, eml_path):
+    return get_conversion_pool().submit(batch_convert.convert_one_file, msg_path, eml_path, retries=0, skip_existing=False,
+                                        collect_metrics=False, limits=conversion_limits)
+
+def conversion_result(future):
+    try:
+        return future.result()
+    except conversion_guard.WorkerFailed as e: # Over the time limit, or the worker crashed
+        return {'status': 'failed', 'error': str(e)}
+
+def convert_uploads_to_zip(uploaded_files, work_dir, zip_path):
+    # Each upload is written to disk, converted by a pool worker straight to a temp .eml, then
+    # appended to the ZIP on disk and deleted, so at most a handful of EMLs exist at any time and
+    # none of them (nor the archive) has to be held in memory. Returns the failed (name, error) pairs.
+    cache = get_conversion_cache()
+    overall_bar = st.progress(0.0, text=f"Converted 0 of {len(uploaded_files)} files")
+    file_bars = [st.progress(0.0, text=f"{uploaded.name}: queued") for uploaded in uploaded_files]
+    used_names = set()
+    archive_names = [batch_convert.unique_name(f"{msg_converter_core.sanitize_filename(os.path.splitext(uploaded.name)[0])}.eml", used_names)
+                     for uploaded in uploaded_files]
+    failures = []
+    finished = 0
+
+    def mark_finished(index, error=None):
+        nonlocal finished
+        finished += 1
+        if error:
+            failures.append((uploaded_files[index].name, error))
+            file_bars[index].progress(1.0, text=f"{uploaded_files[index].name}: failed ❌")
+        else:
+            file_bars[index].progress(1.0, text=f"{uploaded_files[index].name}: done ✅")
+        overall_bar.progress(finished / len(uploaded_files), text=f"Converted {finished} of {len(uploaded_files)} files")
+
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        futures = {}
+        for index, uploaded in enumerate(uploaded_files):
+            msg_bytes = uploaded.getvalue()
+            cache_key = cache.key_for(msg_bytes)
+            cached_eml = cache.get(cache_key)
+            if cached_eml is not None:
+                archive.writestr(archive_names[index], cached_eml)
+                mark_finished(index)
+                continue
+            msg_path = os.path.join(work_dir, f"{index}.msg")
+            eml_path = os.path.join(work_dir, f"{index}.eml")
+            with open(msg_path, 'wb') as f:
+                f.write(msg_bytes)
+            futures[submit_conversion(msg_path, eml_path)] = (index, cache_key, msg_path, eml_path)
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, cache_key, msg_path, eml_path = futures[future]
+                result = conversion_result(future)
+                if result['status'] == 'converted':
+                    archive.write(eml_path, archive_names[index]) # Copied from disk in chunks
+                    cache.put_file(cache_key, eml_path)
+                    mark_finished(index)
+                else:
+                    mark_finished(index, result['error'])
+                for path in (msg_path, eml_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            for future in pending:
+                if future.running():
+                    index = futures[future][0]
+                    file_bars[index].progress(0.5, text=f"{uploaded_files[index].name}: converting...")
+    return failures
+
+def convert_upload_in_pool(uploaded, log_callback):
+    # Single-file conversion in a pool worker, so the time and memory limits apply. Returns
+    # (eml_bytes, suggested_filename) like convert_msg_to_single_eml, or (None, None).
+    cache = get_conversion_cache()
+    msg_bytes = uploaded.getvalue()
+    suggested_filename = f"{msg_converter_core.sanitize_filename(os.path.splitext(uploaded.name)[0])}.eml"
+    cache_key = cache.key_for(msg_bytes)
+    cached_eml = cache.get(cache_key)
+    if cached_eml is not None:
+        log_callback(f"Served from conversion cache ({len(cached_eml)} bytes).")
+        return cached_eml, suggested_filename
+    work_dir = tempfile.mkdtemp(prefix='msg2eml-app-')
+    try:
+        msg_path = os.path.join(work_dir, 'upload.msg')
+        eml_path = os.path.join(work_dir, 'upload.eml')
+        with open(msg_path, 'wb') as f:
+            f.write(msg_bytes)
+        result = conversion_result(submit_conversion(msg_path, eml_path))
+        if result['status'] != 'converted':
+            log_callback(result['error'])
+            return None, None
+        with open(eml_path, 'rb') as f:
+            eml_bytes = f.read()
+        if len(eml_bytes) <= cache.max_entry_bytes:
+            cache.put(cache_key, eml_bytes)
+        log_callback(f"Converted in a worker process ({len(eml_bytes)} bytes).")
+        return eml_bytes, suggested_filename
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+uploaded_files = st.file_uploader("Choose .MSG files", type=["msg"], accept_multiple_files=True)
+uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
 
-if uploaded_file is not None:
+if len(uploaded_files) > 1:
+    total_size = sum(uploaded.size for uploaded in uploaded_files)
+    st.write("---")
+    st.subheader("Uploaded Files:")
+    st.write(f"{len(uploaded_files)} files, {total_size / (1024 * 1024):.1f} MB in total.")
+
+    if st.button(f"Convert {len(uploaded_files)} files to EML (ZIP)"):
+        st.write("---")
+        st.subheader("Conversion Process:")
+        work_dir = tempfile.mkdtemp(prefix='msg2eml-app-')
+        try:
+            zip_path = os.path.join(work_dir, 'converted_emls.zip')
+            failures = convert_uploads_to_zip(uploaded_files, work_dir, zip_path)
+            converted_count = len(uploaded_files) - len(failures)
+            if failures:
+                st.error(f"{len(failures)} of {len(uploaded_files)} files could not be converted.")
+                with st.expander("Show errors"):
+                    st.code("\n".join(f"{name}: {error}" for name, error in failures))
+            if converted_count:
+                st.subheader("Download Your EML Files")
+                with open(zip_path, 'rb') as zip_file: # Read once here; the temp dir is removed below
+                    st.download_button(
+                        label=f"Download converted_emls.zip ({converted_count} EML files)",
+                        data=zip_file,
+                        file_name="converted_emls.zip",
+                        mime="application/zip"
+                    )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+elif uploaded_file is not None:
     file_details = {"FileName": uploaded_file.name, "FileType": uploaded_file.type, "FileSize": uploaded_file.size}
     st.write("---")
     st.subheader("Uploaded File Details:")
@@ -41,11 +228,16 @@ if uploaded_file is not None:
         streamlit_log_callback("Starting conversion...")
         
         with st.spinner("Processing your .msg file... This might take a moment for complex files."):
-            eml_bytes, suggested_download_name = msg_converter_core.convert_msg_to_single_eml(
-                msg_bytes_io, 
-                original_filename_stem,
-                log_callback=streamlit_log_callback
-            )
+            if conversion_limits is not None and conversion_limits.needs_watchdog():
+                eml_bytes, suggested_download_name = convert_upload_in_pool(uploaded_file, streamlit_log_callback)
+            else:
+                eml_bytes, suggested_download_name = msg_converter_core.convert_msg_to_single_eml(
+                    msg_bytes_io, 
+                    original_filename_stem,
+                    log_callback=streamlit_log_callback,
+                    cache=get_conversion_cache(),
+                    **(conversion_limits.converter_kwargs() if conversion_limits is not None else {})
+                )
 
         if eml_bytes and suggested_download_name:
             streamlit_log_callback(f"Conversion successful! ✅")
@@ -61,7 +253,24 @@ if uploaded_file is not None:
             streamlit_log_callback("Conversion failed. 😔 Please check the logs above.")
             st.error("Conversion failed. See logs for details.")
 else:
-    st.info("Upload a .msg file to begin.")
+    st.info("Upload one or more .msg files to begin.")
+
+cache_stats = get_conversion_cache().stats()
+st.caption(f"Conversion cache: {cache_stats['hits']} hit(s), {cache_stats['misses']} miss(es), "
+           f"{cache_stats['memory_entries']} in memory ({cache_stats['memory_bytes'] / (1024 * 1024):.1f} MB), "
+           f"{cache_stats['disk_entries']} on disk ({cache_stats['disk_bytes'] / (1024 * 1024):.1f} MB).")
 
 st.write("---")
-st.markdown("Developed with Streamlit and extract-msg.")
\ No newline at end of file
+st.markdown("Developed with Streamlit and extract-msg.")
+
+# Time to first interaction: reported once per server process, after the first full page render.
+# MSG2EML_LAUNCH_STARTED is set by run_app_launcher.py (seconds since the epoch).
+startup_state = get_startup_state()
+if not startup_state['first_render_reported']:
+    startup_state['first_render_reported'] = True
+    render_message = (f"First page rendered: imports {(IMPORTS_DONE - SCRIPT_STARTED) * 1000:.0f}ms, "
+                      f"script {(time.perf_counter() - SCRIPT_STARTED) * 1000:.0f}ms")
+    launch_started = os.environ.get('MSG2EML_LAUNCH_STARTED')
+    if launch_started:
+        render_message += f", {time.time() - float(launch_started):.2f}s after launch"
+    log_startup(render_message)
\ No newline at end of file
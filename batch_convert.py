@@ -0,0 +1,371 @@
+# batch_convert.py
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+
+import msg_converter_core # Import our conversion logic
+import conversion_guard
+import mbox_export
+from conversion_metrics import ConversionMetrics
+
+# --- Input discovery ---
+def find_msg_files(input_dir):
+    # Walk in sorted order so the report (and output layout) is stable between runs
+    msg_paths = []
+    for dir_path, dir_names, file_names in os.walk(input_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.lower().endswith('.msg'):
+                msg_paths.append(os.path.join(dir_path, file_name))
+    return msg_paths
+
+def output_path_for(msg_path, input_dir, output_dir):
+    relative_dir = os.path.relpath(os.path.dirname(msg_path), input_dir)
+    stem = os.path.splitext(os.path.basename(msg_path))[0]
+    return os.path.normpath(os.path.join(output_dir, relative_dir, f"{msg_converter_core.sanitize_filename(stem)}.eml"))
+
+def output_paths_for(msg_paths, input_dir, output_dir):
+    # output_path_for for a whole batch. Different sources can sanitize to the same .eml ("a b.msg"
+    # and "a_b.msg", or "x.msg" and "x.MSG"), so later ones get a " (2)", " (3)"... suffix and no
+    # output overwrites another. With msg_paths in find_msg_files order the names are stable between runs.
+    used_paths = set()
+    return [unique_name(output_path_for(msg_path, input_dir, output_dir), used_paths) for msg_path in msg_paths]
+
+def unique_name(file_name, used_names):
+    # file_name, or "name (2).ext", "name (3).ext"... if it is already in used_names (compared
+    # case-insensitively, as on Windows and macOS file systems); the chosen name is added to used_names
+    base, extension = os.path.splitext(file_name)
+    candidate, counter = file_name, 2
+    while candidate.lower() in used_names:
+        candidate = f"{base} ({counter}){extension}"
+        counter += 1
+    used_names.add(candidate.lower())
+    return candidate
+
+# --- Worker (runs in a child process) ---
+_worker_blob_store = None # One attachment memo per worker process, shared by all files it converts
+
+def get_worker_blob_store():
+    global _worker_blob_store
+    if _worker_blob_store is None:
+        _worker_blob_store = msg_converter_core.AttachmentBlobStore(max_bytes=64 * 1024 * 1024)
+    return _worker_blob_store
+
+def new_result(msg_path, eml_path):
+    return {
+        'source': msg_path,
+        'output': eml_path,
+        'status': 'failed',
+        'attempts': 0,
+        'input_bytes': 0,
+        'output_bytes': 0,
+        'dedup_bytes_saved': 0,
+        'seconds': 0.0,
+        'stages': None,
+        'error': None,
+        'limit': None, # Which per-file limit the conversion hit, if any (see conversion_guard)
+    }
+
+def convert_one_file(msg_path, eml_path, retries=0, skip_existing=False, collect_metrics=False, limits=None,
+                     mbox_writer=None):
+    # With mbox_writer (an mbox_export.MboxWriter), the EML is streamed into that mbox instead of
+    # being written to eml_path, which is then only used in the report; a failed attempt is taken
+    # back out of the mbox with abort_message().
+    # limits (conversion_guard.ConversionLimits) applies the converter's attachment and nesting
+    # limits; a file that hits one is not retried.
+    result = new_result(msg_path, eml_path)
+    started = time.perf_counter()
+    try:
+        result['input_bytes'] = os.path.getsize(msg_path)
+    except OSError as e:
+        result['error'] = f"Could not stat MSG file: {e}"
+        return result
+
+    if skip_existing and os.path.exists(eml_path):
+        result['status'] = 'skipped'
+        result['output_bytes'] = os.path.getsize(eml_path)
+        return result
+
+    blob_store = get_worker_blob_store()
+    bytes_saved_before = blob_store.bytes_saved
+    logs = []
+    metrics = ConversionMetrics() if collect_metrics or limits is not None else None # Metrics report which limit was hit
+    converter_limits = limits.converter_kwargs() if limits is not None else {}
+    for attempt in range(retries + 1):
+        result['attempts'] = attempt + 1
+        logs.clear()
+        if metrics is not None:
+            metrics.clear()
+        bytes_written = None
+        try:
+            if mbox_writer is None:
+                os.makedirs(os.path.dirname(eml_path) or '.', exist_ok=True)
+            else:
+                mbox_writer.start_message()
+            bytes_written, _ = msg_converter_core.convert_msg_to_eml_stream(
+                msg_path,
+                eml_path if mbox_writer is None else mbox_writer, # Streamed straight to disk, never held in memory as one buffer
+                os.path.splitext(os.path.basename(msg_path))[0],
+                log_callback=logs.append,
+                blob_store=blob_store,
+                metrics_callback=metrics,
+                **converter_limits
+            )
+            if bytes_written is None:
+                result['error'] = logs[-1] if logs else "Conversion failed."
+                result['limit'] = conversion_guard.failed_limit(metrics)
+        except Exception as e: # Never let one bad file take the worker down
+            result['error'] = f"{type(e).__name__}: {e}"
+            result['limit'] = msg_converter_core.limit_reason(e)
+        if mbox_writer is not None:
+            if bytes_written is not None:
+                mbox_writer.end_message()
+            else:
+                mbox_writer.abort_message()
+        if bytes_written is not None:
+            result['status'] = 'converted'
+            result['output_bytes'] = bytes_written
+            result['error'] = None
+            break
+        if result['limit'] is not None:
+            break # Would hit the same limit again
+    result['dedup_bytes_saved'] = blob_store.bytes_saved - bytes_saved_before
+    if collect_metrics:
+        result['stages'] = metrics.stage_totals()
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+# --- Batch driver ---
+class InlineExecutor(Executor):
+    # Runs each task in the calling thread as soon as it is submitted
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+def open_executor(jobs, limits=None):
+    # Watched workers even without limits: a worker killed by a segfault or the OOM killer then
+    # fails only the file it was converting (WorkerFailed) instead of breaking the whole pool
+    if limits is None:
+        limits = conversion_guard.ConversionLimits()
+    return conversion_guard.GuardedPool(max_workers=jobs, timeout=limits.timeout, max_memory_bytes=limits.max_memory_bytes,
+                                        recycle_if=hit_memory_limit, initializer=msg_converter_core.prewarm)
+
+def hit_memory_limit(result):
+    return result['limit'] == 'memory' # The worker's heap is likely fragmented; start a fresh one
+
+def convert_directory(input_dir, output_dir, jobs=None, retries=0, skip_existing=False, collect_metrics=False, log_callback=print,
+                      limits=None, quarantine=None):
+    # limits: conversion_guard.ConversionLimits; quarantine: conversion_guard.Quarantine, which
+    # records files that hit a limit and skips the ones recorded by earlier runs
+    msg_paths = find_msg_files(input_dir)
+    eml_paths = output_paths_for(msg_paths, input_dir, output_dir)
+    jobs = jobs or os.cpu_count() or 1
+    log_callback(f"Found {len(msg_paths)} .msg file(s) under '{input_dir}'. Converting with {jobs} worker(s)...")
+
+    results = []
+    started = time.perf_counter()
+    if msg_paths:
+        with open_executor(jobs, limits) as executor:
+            options = dict(retries=retries, skip_existing=skip_existing, collect_metrics=collect_metrics, limits=limits)
+            tasks = ((msg_path, eml_path, options) for msg_path, eml_path in zip(msg_paths, eml_paths))
+            for index, result in enumerate(convert_in_order(executor, tasks, window=jobs * 4, quarantine=quarantine)):
+                results.append(result)
+                log_result(log_callback, index, len(msg_paths), result)
+    elapsed = time.perf_counter() - started
+    return results, summarize_results(results, elapsed)
+
+def convert_directory_to_mbox(input_dir, mbox_path, jobs=None, retries=0, collect_metrics=False, log_callback=print,
+                              limits=None, quarantine=None):
+    # Writes every message into the single mbox at mbox_path, in input order. With one job each EML
+    # is streamed straight into the mbox, and a conversion that fails halfway is taken back out
+    # (MboxWriter.abort_message). With more, workers convert to temp files in a directory next to
+    # the mbox, which are appended in order once converted and deleted right away. A time or memory
+    # limit also needs the worker path, since a conversion can't be stopped inside this process.
+    msg_paths = find_msg_files(input_dir)
+    jobs = jobs or os.cpu_count() or 1
+    log_callback(f"Found {len(msg_paths)} .msg file(s) under '{input_dir}'. Writing them to '{mbox_path}' with {jobs} worker(s)...")
+
+    results = []
+    started = time.perf_counter()
+    options = dict(retries=retries, collect_metrics=collect_metrics, limits=limits)
+    with mbox_export.open_mbox(mbox_path) as mbox:
+        if msg_paths and jobs == 1 and not (limits is not None and limits.needs_watchdog()):
+            tasks = ((msg_path, mbox_path, dict(options, mbox_writer=mbox)) for msg_path in msg_paths)
+            for index, result in enumerate(convert_in_order(InlineExecutor(), tasks, window=1, quarantine=quarantine)):
+                results.append(result)
+                log_result(log_callback, index, len(msg_paths), result)
+        elif msg_paths:
+            temp_dir = tempfile.mkdtemp(prefix='.msg2eml-', dir=os.path.dirname(os.path.abspath(mbox_path)))
+            try:
+                with open_executor(jobs, limits) as executor:
+                    tasks = ((msg_path, os.path.join(temp_dir, f"{index}.eml"), options) for index, msg_path in enumerate(msg_paths))
+                    for index, result in enumerate(convert_in_order(executor, tasks, window=jobs * 4, quarantine=quarantine)):
+                        if result['status'] == 'converted':
+                            mbox.append_eml_file(result['output'])
+                            os.remove(result['output'])
+                        result['output'] = mbox_path
+                        results.append(result)
+                        log_result(log_callback, index, len(msg_paths), result)
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+    elapsed = time.perf_counter() - started
+    return results, summarize_results(results, elapsed)
+
+def convert_in_order(executor, tasks, window, quarantine=None):
+    # map_in_order for convert_one_file tasks, each a (msg_path, eml_path, options) tuple whose
+    # options dict holds convert_one_file's keyword arguments. Files in the quarantine are skipped,
+    # a task whose worker was stopped (conversion_guard.WorkerFailed) becomes a failed result, and
+    # files that hit a limit are added to the quarantine
+    pending = deque()
+    for msg_path, eml_path, options in tasks:
+        quarantine_entry = quarantine.get(msg_path) if quarantine is not None else None
+        if quarantine_entry is not None:
+            future = Future()
+            future.set_result(quarantined_result(msg_path, eml_path, quarantine_entry))
+        else:
+            future = executor.submit(convert_one_file, msg_path, eml_path, **options)
+        pending.append((msg_path, eml_path, future))
+        if len(pending) >= window:
+            yield finish_conversion(*pending.popleft(), quarantine)
+    while pending:
+        yield finish_conversion(*pending.popleft(), quarantine)
+
+def finish_conversion(msg_path, eml_path, future, quarantine=None):
+    try:
+        result = future.result()
+    except conversion_guard.WorkerFailed as e:
+        result = new_result(msg_path, eml_path)
+        result.update(attempts=1, error=str(e), limit=e.reason if e.reason != 'startup' else None)
+        if e.reason != 'startup' and os.path.exists(eml_path):
+            os.remove(eml_path) # The worker may have been stopped halfway through writing it
+    record_in_quarantine(quarantine, result)
+    return result
+
+def quarantined_result(msg_path, eml_path, quarantine_entry):
+    result = new_result(msg_path, eml_path)
+    result.update(status='skipped', limit=quarantine_entry['reason'],
+                  error=f"Quarantined by an earlier run ({quarantine_entry['reason']}): {quarantine_entry['error']}")
+    return result
+
+def record_in_quarantine(quarantine, result):
+    if quarantine is not None and result['status'] == 'failed' and result['limit'] is not None:
+        quarantine.add(result['source'], result['limit'], result['error'])
+
+def map_in_order(executor, fn, task_args, window):
+    # Like executor.map, but keeps at most `window` tasks submitted ahead of the consumer, so
+    # finished outputs can't pile up on disk while a slow writer (e.g. xz compression) catches up
+    pending = deque()
+    for args in task_args:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def log_result(log_callback, index, total, result):
+    line = f"[{index + 1}/{total}] {result['status'].upper():9} {result['source']}"
+    if result['error']: # Failures, and files skipped because they are quarantined
+        line += f" ({result['error']})"
+    log_callback(line)
+
+def summarize_results(results, elapsed_seconds):
+    converted = [r for r in results if r['status'] == 'converted']
+    input_mb = sum(r['input_bytes'] for r in converted) / (1024 * 1024)
+    return {
+        'total': len(results),
+        'converted': len(converted),
+        'skipped': sum(1 for r in results if r['status'] == 'skipped'),
+        'failed': sum(1 for r in results if r['status'] == 'failed'),
+        'retried': sum(1 for r in results if r['attempts'] > 1),
+        'over_limit': sum(1 for r in results if r['status'] == 'failed' and r['limit'] is not None),
+        'elapsed_seconds': elapsed_seconds,
+        'input_mb': input_mb,
+        'output_mb': sum(r['output_bytes'] for r in converted) / (1024 * 1024),
+        'dedup_mb_saved': sum(r['dedup_bytes_saved'] for r in results) / (1024 * 1024),
+        'files_per_second': len(converted) / elapsed_seconds if elapsed_seconds > 0 else 0.0,
+        'mb_per_second': input_mb / elapsed_seconds if elapsed_seconds > 0 else 0.0,
+    }
+
+def format_summary(summary):
+    over_limit = f", {summary['over_limit']} over a limit" if summary.get('over_limit') else ''
+    return (f"Converted {summary['converted']}/{summary['total']} file(s) "
+            f"({summary['skipped']} skipped, {summary['failed']} failed{over_limit}, {summary['retried']} retried) "
+            f"in {summary['elapsed_seconds']:.2f}s: "
+            f"{summary['files_per_second']:.1f} files/s, {summary['mb_per_second']:.2f} MB/s "
+            f"({summary['input_mb']:.2f} MB in, {summary['output_mb']:.2f} MB out, "
+            f"{summary['dedup_mb_saved']:.2f} MB of duplicate attachment encoding skipped)")
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Convert every .msg file under a directory tree to .eml files in parallel.")
+    parser.add_argument('input_dir', help="Directory to search (recursively) for .msg files.")
+    parser.add_argument('-o', '--output-dir', help="Where to write .eml files (mirrors the input tree). Defaults to '<input_dir>_eml'.")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes. Defaults to the number of CPU cores.")
+    parser.add_argument('--retries', type=int, default=0, help="Retry a failed file this many times before skipping it (default: 0).")
+    parser.add_argument('--skip-existing', action='store_true', help="Do not reconvert files whose .eml output already exists.")
+    parser.add_argument('--mbox', help="Write all messages into this single mbox file instead of separate .eml files. "
+                                       "A .gz, .bz2 or .xz extension compresses it.")
+    parser.add_argument('--report', help="Also write the per-file report and summary as JSON to this path.")
+    parser.add_argument('--metrics', help="Collect per-stage timings and write one JSON line per file to this path.")
+    parser.add_argument('--quarantine', help="JSON-lines list of files that hit a limit (with the reason and limits); listed files are skipped while the limit they hit is as strict.")
+    conversion_guard.add_limit_arguments(parser)
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    input_dir = os.path.abspath(args.input_dir)
+    if not os.path.isdir(input_dir):
+        print(f"Error: input directory not found: {args.input_dir}")
+        return 2
+    if args.mbox and (args.output_dir or args.skip_existing):
+        print("Error: --mbox cannot be combined with --output-dir or --skip-existing.")
+        return 2
+    limits = conversion_guard.limits_from_args(args)
+    quarantine = conversion_guard.Quarantine(os.path.abspath(args.quarantine), limits) if args.quarantine else None
+    if args.mbox:
+        results, summary = convert_directory_to_mbox(input_dir, os.path.abspath(args.mbox),
+                                                     jobs=args.jobs,
+                                                     retries=max(0, args.retries),
+                                                     collect_metrics=bool(args.metrics),
+                                                     limits=limits,
+                                                     quarantine=quarantine)
+    else:
+        output_dir = os.path.abspath(args.output_dir or f"{input_dir.rstrip(os.sep)}_eml")
+        results, summary = convert_directory(input_dir, output_dir,
+                                             jobs=args.jobs,
+                                             retries=max(0, args.retries),
+                                             skip_existing=args.skip_existing,
+                                             collect_metrics=bool(args.metrics),
+                                             limits=limits,
+                                             quarantine=quarantine)
+    print(format_summary(summary))
+    if quarantine is not None and summary['over_limit']:
+        print(f"{summary['over_limit']} file(s) recorded in the quarantine list: {quarantine.path}")
+
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps({'source': result['source'], 'status': result['status'],
+                                    'seconds': result['seconds'], 'input_bytes': result['input_bytes'],
+                                    'stages': result['stages']}) + '\n')
+        print(f"Metrics written to: {args.metrics}")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'files': results}, f, indent=2)
+        print(f"Report written to: {args.report}")
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support() # Needed for the process pool in a PyInstaller build
+    sys.exit(main())
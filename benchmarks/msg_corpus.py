@@ -0,0 +1,244 @@
+# benchmarks/msg_corpus.py
+# Generates reproducible synthetic .msg files (OLE compound files laid out as described in
+# [MS-OXMSG]) entirely offline, using the OLE writer that ships with extract-msg.
+import random
+import struct
+
+from extract_msg.ole_writer import OleWriter
+
+# --- MAPI property tags (id << 16 | type) ---
+PT_LONG = 0x0003
+PT_SYSTIME = 0x0040
+PT_UNICODE = 0x001F
+PT_BINARY = 0x0102
+PT_OBJECT = 0x000D
+
+PR_MESSAGE_CLASS = 0x001A0000 | PT_UNICODE
+PR_SUBJECT = 0x00370000 | PT_UNICODE
+PR_CLIENT_SUBMIT_TIME = 0x00390000 | PT_SYSTIME
+PR_MESSAGE_DELIVERY_TIME = 0x0E060000 | PT_SYSTIME
+PR_BODY = 0x10000000 | PT_UNICODE
+PR_HTML = 0x10130000 | PT_BINARY
+PR_INTERNET_MESSAGE_ID = 0x10350000 | PT_UNICODE
+PR_SENDER_NAME = 0x0C1A0000 | PT_UNICODE
+PR_SENDER_ADDRTYPE = 0x0C1E0000 | PT_UNICODE
+PR_SENDER_EMAIL_ADDRESS = 0x0C1F0000 | PT_UNICODE
+PR_SENDER_SMTP_ADDRESS = 0x5D010000 | PT_UNICODE
+PR_SENT_REPRESENTING_NAME = 0x00420000 | PT_UNICODE
+PR_SENT_REPRESENTING_EMAIL_ADDRESS = 0x00650000 | PT_UNICODE
+PR_STORE_SUPPORT_MASK = 0x340D0000 | PT_LONG
+PR_RECIPIENT_TYPE = 0x0C150000 | PT_LONG
+PR_DISPLAY_NAME = 0x30010000 | PT_UNICODE
+PR_ADDRTYPE = 0x30020000 | PT_UNICODE
+PR_EMAIL_ADDRESS = 0x30030000 | PT_UNICODE
+PR_SMTP_ADDRESS = 0x39FE0000 | PT_UNICODE
+PR_ATTACH_DATA_BIN = 0x37010000 | PT_BINARY
+PR_ATTACH_DATA_OBJ = 0x37010000 | PT_OBJECT
+PR_ATTACH_FILENAME = 0x37040000 | PT_UNICODE
+PR_ATTACH_METHOD = 0x37050000 | PT_LONG
+PR_ATTACH_LONG_FILENAME = 0x37070000 | PT_UNICODE
+
+STORE_UNICODE_OK = 0x00040000
+ATTACH_BY_VALUE = 1
+ATTACH_EMBEDDED_MSG = 5
+MAPI_TO = 1
+MAPI_CC = 2
+FILETIME_2024_01_01 = 133485408000000000
+
+PROPERTY_FLAGS = 0x00000006 # PROPATTR_READABLE | PROPATTR_WRITABLE
+
+# --- Message model ---
+class SyntheticAttachment:
+    def __init__(self, filename, data=None, embedded_message=None):
+        self.filename = filename
+        self.data = data
+        self.embedded_message = embedded_message
+
+class SyntheticMessage:
+    def __init__(self, subject, plain_body=None, html_body=None, sender=None, recipients=(), attachments=(),
+                 message_id=None, submit_filetime=FILETIME_2024_01_01):
+        self.subject = subject
+        self.plain_body = plain_body
+        self.html_body = html_body
+        self.sender = sender # (display name, smtp address)
+        self.recipients = list(recipients) # (display name, smtp address, MAPI_TO / MAPI_CC)
+        self.attachments = list(attachments)
+        self.message_id = message_id
+        self.submit_filetime = submit_filetime
+
+# --- OLE / MSG writing ---
+def _unicode(value):
+    return value.encode('utf-16-le')
+
+def _properties_stream(header, fixed_properties, variable_properties):
+    stream = bytearray(header)
+    for tag, value in fixed_properties:
+        stream += struct.pack('<IIQ', tag, PROPERTY_FLAGS, value)
+    for tag, data in variable_properties:
+        # Variable-length entries store the size; strings count their (unstored) null terminator
+        size = len(data) + 2 if tag & 0xFFFF == PT_UNICODE else len(data)
+        stream += struct.pack('<IIII', tag, PROPERTY_FLAGS, size, 0)
+    return bytes(stream)
+
+def _add_streams(writer, prefix, variable_properties):
+    for tag, data in variable_properties:
+        writer.addEntry(prefix + [f'__substg1.0_{tag:08X}'], data)
+
+def _add_message(writer, prefix, message, is_top_level):
+    variable_properties = [(PR_MESSAGE_CLASS, _unicode('IPM.Note')), (PR_SUBJECT, _unicode(message.subject))]
+    if message.plain_body is not None:
+        variable_properties.append((PR_BODY, _unicode(message.plain_body)))
+    if message.html_body is not None:
+        variable_properties.append((PR_HTML, message.html_body.encode('utf-8')))
+    if message.sender:
+        sender_name, sender_address = message.sender
+        variable_properties += [
+            (PR_SENDER_NAME, _unicode(sender_name)),
+            (PR_SENDER_ADDRTYPE, _unicode('SMTP')),
+            (PR_SENDER_EMAIL_ADDRESS, _unicode(sender_address)),
+            (PR_SENDER_SMTP_ADDRESS, _unicode(sender_address)),
+            (PR_SENT_REPRESENTING_NAME, _unicode(sender_name)),
+            (PR_SENT_REPRESENTING_EMAIL_ADDRESS, _unicode(sender_address)),
+        ]
+    if message.message_id:
+        variable_properties.append((PR_INTERNET_MESSAGE_ID, _unicode(message.message_id)))
+    fixed_properties = [
+        (PR_CLIENT_SUBMIT_TIME, message.submit_filetime),
+        (PR_MESSAGE_DELIVERY_TIME, message.submit_filetime),
+        (PR_STORE_SUPPORT_MASK, STORE_UNICODE_OK),
+    ]
+    counts = (len(message.recipients), len(message.attachments), len(message.recipients), len(message.attachments))
+    if is_top_level:
+        header = struct.pack('<8sIIII8s', b'', *counts, b'')
+    else:
+        header = struct.pack('<8sIIII', b'', *counts) # Embedded messages use the short header
+    _add_streams(writer, prefix, variable_properties)
+    writer.addEntry(prefix + ['__properties_version1.0'], _properties_stream(header, fixed_properties, variable_properties))
+
+    for recipient_index, (name, address, recipient_type) in enumerate(message.recipients):
+        recipient_prefix = prefix + [f'__recip_version1.0_#{recipient_index:08X}']
+        writer.addEntry(recipient_prefix, storage=True)
+        recipient_properties = [
+            (PR_DISPLAY_NAME, _unicode(name)),
+            (PR_ADDRTYPE, _unicode('SMTP')),
+            (PR_EMAIL_ADDRESS, _unicode(address)),
+            (PR_SMTP_ADDRESS, _unicode(address)),
+        ]
+        _add_streams(writer, recipient_prefix, recipient_properties)
+        writer.addEntry(recipient_prefix + ['__properties_version1.0'],
+                        _properties_stream(b'\0' * 8, [(PR_RECIPIENT_TYPE, recipient_type)], recipient_properties))
+
+    for attachment_index, attachment in enumerate(message.attachments):
+        attachment_prefix = prefix + [f'__attach_version1.0_#{attachment_index:08X}']
+        writer.addEntry(attachment_prefix, storage=True)
+        attachment_properties = [(PR_ATTACH_LONG_FILENAME, _unicode(attachment.filename)),
+                                 (PR_ATTACH_FILENAME, _unicode(attachment.filename[:12]))]
+        if attachment.embedded_message is None:
+            attachment_properties.append((PR_ATTACH_DATA_BIN, attachment.data))
+            fixed_attachment_properties = [(PR_ATTACH_METHOD, ATTACH_BY_VALUE)]
+        else:
+            fixed_attachment_properties = [(PR_ATTACH_METHOD, ATTACH_EMBEDDED_MSG), (PR_ATTACH_DATA_OBJ, 0xFFFFFFFF)]
+        _add_streams(writer, attachment_prefix, attachment_properties)
+        writer.addEntry(attachment_prefix + ['__properties_version1.0'],
+                        _properties_stream(b'\0' * 8, fixed_attachment_properties, attachment_properties))
+        if attachment.embedded_message is not None:
+            embedded_prefix = attachment_prefix + [f'__substg1.0_{PR_ATTACH_DATA_OBJ:08X}']
+            writer.addEntry(embedded_prefix, storage=True)
+            _add_message(writer, embedded_prefix, attachment.embedded_message, is_top_level=False)
+
+def write_msg(message, path):
+    writer = OleWriter()
+    # Named property mapping storage; empty, but extract-msg expects it to exist
+    writer.addEntry(['__nameid_version1.0'], storage=True)
+    for stream_name in ('__substg1.0_00020102', '__substg1.0_00030102', '__substg1.0_00040102'):
+        writer.addEntry(['__nameid_version1.0', stream_name], b'')
+    _add_message(writer, [], message, is_top_level=True)
+    writer.write(path)
+
+# --- Synthetic content ---
+WORDS = ("invoice quarterly report meeting agenda follow up attached please review budget forecast project "
+         "deadline customer contract renewal shipment schedule thanks regards update status draft final").split()
+
+def random_bytes(rng, size):
+    return rng.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+
+def random_text(rng, approx_chars):
+    words = []
+    length = 0
+    while length < approx_chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    lines = [' '.join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    return '\n'.join(lines) + '\n'
+
+def random_html(rng, approx_chars):
+    paragraphs = random_text(rng, approx_chars).splitlines()
+    return '<html><body>' + ''.join(f'<p>{p}</p>' for p in paragraphs) + '</body></html>'
+
+def random_address(rng, index):
+    return f"User {index}", f"user{index}.{rng.randrange(10 ** 6)}@example.com"
+
+def make_message(rng, subject, recipients=2, plain_chars=2000, html_chars=0, attachments=()):
+    recipient_list = []
+    for recipient_index in range(recipients):
+        name, address = random_address(rng, recipient_index)
+        recipient_list.append((name, address, MAPI_TO if recipient_index % 3 else MAPI_CC))
+    return SyntheticMessage(
+        subject,
+        plain_body=random_text(rng, plain_chars) if plain_chars else None,
+        html_body=random_html(rng, html_chars) if html_chars else None,
+        sender=random_address(rng, 'sender'),
+        recipients=recipient_list,
+        attachments=attachments,
+        message_id=f"<{rng.randrange(10 ** 12)}@bench.example.com>",
+    )
+
+# --- Scenarios ---
+# Each scenario builds one message from a seeded RNG; `scale` multiplies the payload sizes.
+def scenario_many_recipients(rng, scale):
+    return make_message(rng, "Many recipients", recipients=int(2000 * scale), plain_chars=4000)
+
+def scenario_deep_nesting(rng, scale):
+    depth = max(2, int(12 * scale))
+    message = make_message(rng, f"Level {depth}", plain_chars=1500, html_chars=3000,
+                           attachments=[SyntheticAttachment('note.txt', random_text(rng, 2000).encode('utf-8'))])
+    for level in range(depth - 1, -1, -1):
+        message = make_message(rng, f"FW: Level {level}", plain_chars=1500, html_chars=3000,
+                               attachments=[SyntheticAttachment(f'level{level + 1}.msg', embedded_message=message),
+                                            SyntheticAttachment(f'scan{level}.pdf', random_bytes(rng, int(64 * 1024 * scale)))])
+    return message
+
+def scenario_large_binary_attachments(rng, scale):
+    attachments = [SyntheticAttachment(f'archive{i}.zip', random_bytes(rng, int(8 * 1024 * 1024 * scale))) for i in range(4)]
+    return make_message(rng, "Large binary attachments", plain_chars=1000, attachments=attachments)
+
+def scenario_large_text_attachments(rng, scale):
+    attachments = [SyntheticAttachment(f'export{i}.csv', random_text(rng, int(2 * 1024 * 1024 * scale)).encode('utf-8')) for i in range(4)]
+    return make_message(rng, "Large text attachments", plain_chars=1000, attachments=attachments)
+
+def scenario_html_and_plain(rng, scale):
+    return make_message(rng, "HTML and plain bodies", plain_chars=int(512 * 1024 * scale), html_chars=int(1024 * 1024 * scale))
+
+def scenario_forwarded_duplicates(rng, scale):
+    shared_pdf = SyntheticAttachment('contract.pdf', random_bytes(rng, int(2 * 1024 * 1024 * scale)))
+    shared_logo = SyntheticAttachment('logo.png', random_bytes(rng, 24 * 1024))
+    message = make_message(rng, "Original", html_chars=4000, attachments=[shared_pdf, shared_logo])
+    for level in range(6):
+        message = make_message(rng, f"RE: Original ({level})", html_chars=4000,
+                               attachments=[shared_logo, shared_pdf, SyntheticAttachment(f'reply{level}.msg', embedded_message=message)])
+    return message
+
+SCENARIOS = {
+    'many_recipients': scenario_many_recipients,
+    'deep_nesting': scenario_deep_nesting,
+    'large_binary_attachments': scenario_large_binary_attachments,
+    'large_text_attachments': scenario_large_text_attachments,
+    'html_and_plain': scenario_html_and_plain,
+    'forwarded_duplicates': scenario_forwarded_duplicates,
+}
+
+def generate_scenario(name, path, seed=0, scale=1.0):
+    rng = random.Random(f"{name}:{seed}")
+    write_msg(SCENARIOS[name](rng, scale), path)
+    return path
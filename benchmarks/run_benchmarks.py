@@ -0,0 +1,227 @@
+# benchmarks/run_benchmarks.py
+# Runs the converter over the synthetic corpus from msg_corpus.py and writes machine-readable
+# results (wall time, per-stage time from the converter's metrics hook, peak RSS) that can be
+# compared between commits:
+#
+#   python benchmarks/run_benchmarks.py -o before.json
+#   ... change the code ...
+#   python benchmarks/run_benchmarks.py -o after.json --compare before.json
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import msg_corpus
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+class _NullSink:
+    # Discards output; keeps disk speed out of the measurement
+    def write(self, data):
+        return len(data)
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Linux reports KiB, macOS bytes
+
+# --- Measurement (runs in a fresh child process per scenario, so peak RSS is per scenario) ---
+def measure_conversion(msg_path, repeats):
+    import msg_converter_core
+    from conversion_metrics import ConversionMetrics
+
+    rss_before = peak_rss_bytes()
+    # Untimed warm-up: the first conversion in a process also pays for lazy imports inside extract-msg
+    msg_converter_core.convert_msg_to_eml_stream(msg_path, _NullSink(), 'bench', log_callback=None)
+
+    # Wall time with instrumentation off, which is how the converter normally runs
+    wall_samples = []
+    output_bytes = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        output_bytes, _ = msg_converter_core.convert_msg_to_eml_stream(msg_path, _NullSink(), 'bench', log_callback=None)
+        wall_samples.append(time.perf_counter() - started)
+
+    # Per-stage times from the converter's metrics hook (summed per run, e.g. over all attachments)
+    stage_samples = {}
+    for _ in range(repeats):
+        metrics = ConversionMetrics()
+        msg_converter_core.convert_msg_to_eml_stream(msg_path, _NullSink(), 'bench', log_callback=None, metrics_callback=metrics)
+        for stage, stage_total in metrics.stage_totals().items():
+            stage_samples.setdefault(stage, []).append(stage_total['seconds'])
+
+    return {
+        'input_bytes': os.path.getsize(msg_path),
+        'output_bytes': output_bytes,
+        'wall_seconds': summarize_samples(wall_samples),
+        'stage_seconds': {stage: summarize_samples(samples) for stage, samples in stage_samples.items()},
+        'baseline_rss_bytes': rss_before,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+# How often run_isolated checks whether the measuring process is still alive
+RESULT_POLL_SECONDS = 1.0
+
+def _measure_in_child(msg_path, repeats, result_queue):
+    try:
+        result_queue.put(measure_conversion(msg_path, repeats))
+    except Exception as e:
+        result_queue.put({'error': f"{type(e).__name__}: {e}"})
+
+def run_isolated(msg_path, repeats):
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=_measure_in_child, args=(msg_path, repeats, result_queue))
+    process.start()
+    while True:
+        try:
+            result = result_queue.get(timeout=RESULT_POLL_SECONDS)
+            break
+        except queue.Empty:
+            if process.exitcode is None:
+                continue
+            try: # The child may have exited just after putting its result
+                result = result_queue.get(timeout=RESULT_POLL_SECONDS)
+            except queue.Empty: # Crashed or was killed (e.g. by the OOM killer) before reporting
+                result = {'error': f"Benchmark process exited with code {process.exitcode} without a result"}
+            break
+    process.join()
+    return result
+
+def summarize_samples(samples):
+    return {
+        'median': statistics.median(samples),
+        'min': min(samples),
+        'max': max(samples),
+        'runs': len(samples),
+    }
+
+# --- Corpus ---
+def ensure_corpus(corpus_dir, scenario_names, seed, scale):
+    os.makedirs(corpus_dir, exist_ok=True)
+    paths = {}
+    for name in scenario_names:
+        path = os.path.join(corpus_dir, f"{name}-seed{seed}-x{scale:g}.msg")
+        if not os.path.exists(path): # Generation is deterministic, so an existing file can be reused
+            msg_corpus.generate_scenario(name, path, seed=seed, scale=scale)
+        paths[name] = path
+    return paths
+
+# --- Reporting ---
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment_info(seed, scale, repeats):
+    try:
+        import extract_msg
+        extract_msg_version = getattr(extract_msg, '__version__', None)
+    except ImportError:
+        extract_msg_version = None
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'extract_msg': extract_msg_version,
+        'seed': seed,
+        'scale': scale,
+        'repeats': repeats,
+    }
+
+def compare_results(current, baseline, threshold):
+    # Returns printable lines and whether any scenario regressed by more than threshold (a fraction)
+    lines = []
+    regressed = False
+    for name, result in current['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or 'error' in result or 'error' in previous:
+            continue
+        for label, unit, scale, now, before in (
+                ('wall', 'ms', 1000, result['wall_seconds']['median'], previous['wall_seconds']['median']),
+                ('peak_rss', 'MB', 1 / (1024 * 1024), result['peak_rss_bytes'], previous['peak_rss_bytes'])):
+            if not now or not before:
+                continue
+            change = (now - before) / before
+            flag = ''
+            if change > threshold:
+                flag = '  <-- REGRESSION'
+                regressed = True
+            lines.append(f"{name:28} {label:9} {before * scale:10.1f}{unit} -> {now * scale:10.1f}{unit} ({change:+.1%}){flag}")
+    return lines, regressed
+
+# Top-level stages for the one-line summary; the JSON keeps every stage the metrics hook reports
+REPORTED_STAGES = ('ole_parse', 'attachment_load', 'headers', 'body', 'attachment', 'attachment_encode', 'serialize')
+
+def format_result_line(name, result):
+    if 'error' in result:
+        return f"{name:28} ERROR: {result['error']}"
+    stages = ', '.join(f"{stage} {samples['median'] * 1000:.1f}ms" for stage, samples in result['stage_seconds'].items()
+                       if stage in REPORTED_STAGES)
+    peak_rss = result['peak_rss_bytes']
+    peak_text = f"{peak_rss / (1024 * 1024):.1f} MB" if peak_rss else 'n/a'
+    return (f"{name:28} wall {result['wall_seconds']['median'] * 1000:8.1f}ms  ({stages})  "
+            f"peak RSS {peak_text}  {result['input_bytes'] / (1024 * 1024):.1f} MB in")
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark MSG to EML conversion on a synthetic, reproducible corpus.")
+    parser.add_argument('-o', '--output', help="Write the results as JSON to this path.")
+    parser.add_argument('--compare', help="Baseline results JSON to compare against.")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative slowdown treated as a regression (default: 0.10).")
+    parser.add_argument('--scenario', action='append', choices=sorted(msg_corpus.SCENARIOS), help="Only run this scenario (repeatable).")
+    parser.add_argument('--repeats', type=int, default=3, help="Runs per scenario; medians are reported (default: 3).")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiplier for payload sizes (default: 1.0).")
+    parser.add_argument('--seed', type=int, default=0, help="Corpus seed (default: 0).")
+    parser.add_argument('--corpus-dir', default=os.path.join(BENCHMARKS_DIR, '.corpus'), help="Where generated .msg files are kept.")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    scenario_names = args.scenario or list(msg_corpus.SCENARIOS)
+    corpus_paths = ensure_corpus(args.corpus_dir, scenario_names, args.seed, args.scale)
+
+    report = {'meta': environment_info(args.seed, args.scale, args.repeats), 'results': {}}
+    for name in scenario_names:
+        result = run_isolated(corpus_paths[name], max(1, args.repeats))
+        report['results'][name] = result
+        print(format_result_line(name, result))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        lines, regressed = compare_results(report, baseline, args.threshold)
+        baseline_meta = baseline.get('meta', {})
+        if (baseline_meta.get('seed'), baseline_meta.get('scale')) != (args.seed, args.scale):
+            print(f"WARNING: baseline was run with seed {baseline_meta.get('seed')} / scale {baseline_meta.get('scale')}; the numbers are not comparable.")
+        print(f"Compared with {args.compare} (commit {baseline_meta.get('commit')}):")
+        for line in lines:
+            print(f"  {line}")
+        return 1 if regressed else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
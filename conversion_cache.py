@@ -0,0 +1,279 @@
+# conversion_cache.py
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Bump when the converter's output changes, so stale on-disk entries are never served
+CACHE_KEY_VERSION = b'msg2eml-v1'
+COPY_CHUNK_BYTES = 1024 * 1024
+
+def cache_key_for_msg_bytes(msg_bytes):
+    digest = hashlib.sha256(CACHE_KEY_VERSION)
+    digest.update(msg_bytes)
+    return digest.hexdigest()
+
+class ConversionCache:
+    # Content-addressed cache of converted EML bytes, keyed by a hash of the MSG bytes.
+    # Tier 1 is an in-memory LRU bounded by total bytes; tier 2 (optional) is a directory of
+    # <key>.eml files bounded by total bytes, evicting the least recently used file first.
+    # Safe to share between threads (Streamlit runs each session in its own thread); disk reads and
+    # writes happen outside the lock, so a slow disk does not hold up memory hits in other sessions.
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=512 * 1024 * 1024, max_entry_bytes=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        # Conversions larger than this are not cached at all (keeps a single huge EML from flushing everything)
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max(max_memory_bytes, max_disk_bytes if disk_dir else 0)
+        self._lock = threading.Lock()
+        self._memory_entries = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_entries = OrderedDict() # key -> size, least recently used first
+        self._disk_bytes = 0
+        self._stats = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    # --- Public API ---
+    def key_for(self, msg_bytes):
+        return cache_key_for_msg_bytes(msg_bytes)
+
+    def get(self, key):
+        with self._lock:
+            eml_bytes = self._memory_entries.get(key)
+            if eml_bytes is not None:
+                self._memory_entries.move_to_end(key)
+                self._stats['hits'] += 1
+                self._stats['memory_hits'] += 1
+                return eml_bytes
+            if key not in self._disk_entries:
+                self._stats['misses'] += 1
+                return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                eml_bytes = f.read()
+        except OSError: # Evicted in the meantime, or removed behind our back
+            with self._lock:
+                self._forget_disk_entry(key)
+                self._stats['misses'] += 1
+            return None
+        self._touch(key)
+        with self._lock:
+            if key in self._disk_entries:
+                self._disk_entries.move_to_end(key)
+            self._store_in_memory(key, eml_bytes) # Promote to the fast tier
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+        return eml_bytes
+
+    def put(self, key, eml_bytes):
+        if len(eml_bytes) > self.max_entry_bytes:
+            return False
+        with self._lock:
+            self._store_in_memory(key, eml_bytes)
+            self._stats['stores'] += 1
+        if self.disk_dir and len(eml_bytes) <= self.max_disk_bytes:
+            temp_path = self._write_temp_file(eml_bytes)
+            if temp_path is not None:
+                self._adopt_disk_file(key, temp_path, len(eml_bytes))
+        return True
+
+    def put_file(self, key, eml_path):
+        # Like put() for an EML on disk, copied in chunks so a large entry never sits in memory
+        entry_writer = self.entry_writer(key)
+        try:
+            with open(eml_path, 'rb') as f:
+                while not entry_writer.discarded:
+                    chunk = f.read(COPY_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    entry_writer.write(chunk)
+        except OSError:
+            entry_writer.discard()
+        return entry_writer.commit()
+
+    def entry_writer(self, key):
+        # A file-like sink that collects an entry while the EML is streamed elsewhere; commit()
+        # stores it, discard() drops it (see CacheEntryWriter)
+        return CacheEntryWriter(self, key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats,
+                        hit_rate=self._stats['hits'] / lookups if lookups else 0.0,
+                        memory_entries=len(self._memory_entries),
+                        memory_bytes=self._memory_bytes,
+                        disk_entries=len(self._disk_entries),
+                        disk_bytes=self._disk_bytes)
+
+    def clear(self):
+        with self._lock:
+            self._memory_entries.clear()
+            self._memory_bytes = 0
+            for key in list(self._disk_entries):
+                self._remove_disk_file(key)
+                self._forget_disk_entry(key)
+
+    # --- Memory tier ---
+    def _store_in_memory(self, key, eml_bytes):
+        if len(eml_bytes) > self.max_memory_bytes:
+            return
+        previous = self._memory_entries.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory_entries[key] = eml_bytes
+        self._memory_bytes += len(eml_bytes)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory_entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats['evictions'] += 1
+
+    # --- Disk tier ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.eml")
+
+    def _load_disk_index(self):
+        found = []
+        for file_name in os.listdir(self.disk_dir):
+            if not file_name.endswith('.eml'):
+                continue
+            try:
+                file_stat = os.stat(os.path.join(self.disk_dir, file_name))
+            except OSError:
+                continue
+            found.append((file_stat.st_mtime, file_name[:-4], file_stat.st_size))
+        for _, key, size in sorted(found): # Oldest first, so they are evicted first
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+
+    def _new_temp_file(self):
+        # Entries are written to a temp file in the same directory and renamed, so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        return os.fdopen(fd, 'wb'), temp_path
+
+    def _write_temp_file(self, eml_bytes):
+        try:
+            f, temp_path = self._new_temp_file()
+        except OSError:
+            return None
+        try:
+            with f:
+                f.write(eml_bytes)
+        except OSError:
+            _remove_quietly(temp_path)
+            return None
+        return temp_path
+
+    def _adopt_disk_file(self, key, temp_path, size):
+        # Moves a complete temp file into place as the disk entry for key
+        with self._lock:
+            if key in self._disk_entries:
+                self._disk_entries.move_to_end(key)
+                _remove_quietly(temp_path)
+                self._touch(key)
+                return
+            try:
+                os.replace(temp_path, self._disk_path(key))
+            except OSError:
+                _remove_quietly(temp_path)
+                return
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+            while self._disk_bytes > self.max_disk_bytes:
+                oldest_key = next(iter(self._disk_entries))
+                self._remove_disk_file(oldest_key)
+                self._forget_disk_entry(oldest_key)
+                self._stats['evictions'] += 1
+
+    def _touch(self, key):
+        try:
+            os.utime(self._disk_path(key)) # mtime doubles as the LRU order after a restart
+        except OSError:
+            pass
+
+    def _remove_disk_file(self, key):
+        _remove_quietly(self._disk_path(key))
+
+    def _forget_disk_entry(self, key):
+        size = self._disk_entries.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+class CacheEntryWriter:
+    # Collects one entry for a ConversionCache while the EML is written somewhere else. Up to the
+    # memory tier's size the entry is kept in memory; a larger one goes to a temp file in the disk
+    # tier (or is dropped when there is none), so caching a big conversion never holds it in RAM.
+    def __init__(self, cache, key):
+        self._cache = cache
+        self._key = key
+        self._chunks = []
+        self._spill_file = None
+        self._spill_path = None
+        self.size = 0
+        self.discarded = False
+
+    def write(self, data):
+        if self.discarded:
+            return
+        self.size += len(data)
+        if self.size > self._cache.max_entry_bytes:
+            self.discard()
+            return
+        if self._spill_file is None and self.size > self._cache.max_memory_bytes:
+            if not self._cache.disk_dir or self.size > self._cache.max_disk_bytes:
+                self.discard()
+                return
+            try:
+                self._spill_file, self._spill_path = self._cache._new_temp_file()
+                for chunk in self._chunks:
+                    self._spill_file.write(chunk)
+            except OSError:
+                self.discard()
+                return
+            self._chunks = None
+        if self._spill_file is None:
+            self._chunks.append(bytes(data))
+            return
+        try:
+            self._spill_file.write(data)
+        except OSError:
+            self.discard()
+
+    def commit(self):
+        # Stores the entry; returns False if it was discarded
+        if self.discarded:
+            return False
+        self.discarded = True # A writer is only committed once
+        if self._spill_file is None:
+            chunks, self._chunks = self._chunks, None
+            return self._cache.put(self._key, b''.join(chunks))
+        spill_file, self._spill_file = self._spill_file, None
+        try:
+            spill_file.close()
+        except OSError:
+            _remove_quietly(self._spill_path)
+            return False
+        self._cache._adopt_disk_file(self._key, self._spill_path, self.size)
+        with self._cache._lock:
+            self._cache._stats['stores'] += 1
+        return True
+
+    def discard(self):
+        self.discarded = True
+        self._chunks = None
+        if self._spill_file is not None:
+            try:
+                self._spill_file.close()
+            except OSError:
+                pass
+            _remove_quietly(self._spill_path)
+            self._spill_file = None
@@ -0,0 +1,407 @@
+# conversion_guard.py
+# Per-conversion budgets, so one pathological MSG can't stall or take down a whole batch:
+#
+#   limits = ConversionLimits(timeout=60, max_memory_bytes=1024 * 1024 * 1024, max_attachments=500)
+#   with GuardedPool(max_workers=4, timeout=limits.timeout, max_memory_bytes=limits.max_memory_bytes) as pool:
+#       future = pool.submit(batch_convert.convert_one_file, msg_path, eml_path, limits=limits)
+#
+# GuardedPool is a concurrent.futures executor whose worker processes are watched: a task that runs
+# past the timeout gets its worker killed, a worker that dies (segfault, OOM killer) is replaced,
+# and either way only that task fails (with WorkerFailed) while the others carry on. The memory
+# limit caps each worker's address space (RLIMIT_AS), so runaway allocations raise MemoryError
+# inside the worker instead of swapping the machine. Attachment count/size and nesting depth are
+# checked by the converter itself (msg_converter_core.ConversionLimitExceeded).
+# Quarantine is the JSON-lines list of files that hit a limit, which later runs skip.
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from multiprocessing import connection as mp_connection
+
+# --- Limits ---
+class ConversionLimits:
+    # None means unlimited. timeout and max_memory_bytes need a GuardedPool to be enforced; the
+    # others are passed to the converter (see converter_kwargs).
+    def __init__(self, timeout=None, max_memory_bytes=None, max_attachments=None, max_attachment_bytes=None,
+                 max_nesting_depth=None):
+        self.timeout = timeout
+        self.max_memory_bytes = max_memory_bytes
+        self.max_attachments = max_attachments
+        self.max_attachment_bytes = max_attachment_bytes
+        self.max_nesting_depth = max_nesting_depth
+
+    def needs_watchdog(self):
+        return self.timeout is not None or self.max_memory_bytes is not None
+
+    def converter_kwargs(self):
+        return {
+            'max_attachments': self.max_attachments,
+            'max_attachment_bytes': self.max_attachment_bytes,
+            'max_nesting_depth': self.max_nesting_depth,
+        }
+
+    def __repr__(self):
+        set_limits = ', '.join(f"{name}={value}" for name, value in vars(self).items() if value is not None)
+        return f"ConversionLimits({set_limits})"
+
+def _positive_or_none(value):
+    return value if value is not None and value > 0 else None
+
+def _megabytes(value):
+    return int(value * 1024 * 1024) if value is not None and value > 0 else None
+
+def add_limit_arguments(parser):
+    group = parser.add_argument_group('per-file limits', "Files that exceed a limit fail with the reason and the run carries on.")
+    group.add_argument('--timeout', type=float, default=None, help="Stop a conversion (and recycle its worker) after this many seconds.")
+    group.add_argument('--max-memory-mb', type=int, default=None, help="Address space limit per worker process in MB (not enforced on Windows).")
+    group.add_argument('--max-attachments', type=int, default=None, help="Fail messages with more attachments than this, nested ones included.")
+    group.add_argument('--max-attachment-mb', type=float, default=None, help="Fail messages with an attachment larger than this many MB.")
+    group.add_argument('--max-nesting-depth', type=int, default=None, help="Fail messages with nested MSGs deeper than this.")
+    return group
+
+def limits_from_args(args):
+    # Returns ConversionLimits, or None when no limit was given
+    limits = ConversionLimits(timeout=_positive_or_none(args.timeout),
+                              max_memory_bytes=_megabytes(args.max_memory_mb),
+                              max_attachments=args.max_attachments if args.max_attachments is not None and args.max_attachments >= 0 else None,
+                              max_attachment_bytes=_megabytes(args.max_attachment_mb),
+                              max_nesting_depth=args.max_nesting_depth if args.max_nesting_depth is not None and args.max_nesting_depth >= 0 else None)
+    return limits if any(value is not None for value in vars(limits).values()) else None
+
+def limits_from_env(environ=os.environ):
+    # Same limits for the Streamlit app: MSG2EML_TIMEOUT_SECONDS, MSG2EML_MAX_MEMORY_MB,
+    # MSG2EML_MAX_ATTACHMENTS, MSG2EML_MAX_ATTACHMENT_MB, MSG2EML_MAX_NESTING_DEPTH
+    def number(name, convert):
+        value = environ.get(name)
+        return convert(value) if value else None
+    limits = ConversionLimits(timeout=_positive_or_none(number('MSG2EML_TIMEOUT_SECONDS', float)),
+                              max_memory_bytes=_megabytes(number('MSG2EML_MAX_MEMORY_MB', float)),
+                              max_attachments=number('MSG2EML_MAX_ATTACHMENTS', int),
+                              max_attachment_bytes=_megabytes(number('MSG2EML_MAX_ATTACHMENT_MB', float)),
+                              max_nesting_depth=number('MSG2EML_MAX_NESTING_DEPTH', int))
+    return limits if any(value is not None for value in vars(limits).values()) else None
+
+def failed_limit(metrics):
+    # The limit a failed conversion hit, from its conversion_metrics.ConversionMetrics events
+    # (see msg_converter_core.convert_msg_to_eml_stream), or None
+    for event in reversed(metrics.events if metrics is not None else []):
+        if event['stage'] == 'conversion':
+            return event.get('limit')
+    return None
+
+# --- Watched worker pool ---
+class WorkerFailed(Exception):
+    # Raised by a GuardedPool future whose worker had to be stopped; reason is 'timeout' or 'crashed',
+    # or 'startup' when no worker could be started for it (a setup problem rather than a bad input)
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+def apply_memory_limit(max_memory_bytes):
+    # Caps this process's address space; returns False where that isn't supported (Windows)
+    try:
+        import resource
+    except ImportError:
+        return False
+    try:
+        _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+        if hard_limit != resource.RLIM_INFINITY:
+            max_memory_bytes = min(max_memory_bytes, hard_limit)
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory_bytes, hard_limit))
+    except (ValueError, OSError, AttributeError):
+        return False
+    return True
+
+def _worker_main(task_connection, max_memory_bytes, initializer, initargs):
+    if max_memory_bytes is not None:
+        apply_memory_limit(max_memory_bytes)
+    if initializer is not None:
+        initializer(*initargs)
+    task_connection.send(('ready', None)) # Startup (imports, initializer) doesn't count towards a task's timeout
+    while True:
+        try:
+            task = task_connection.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        fn, args, kwargs = task
+        try:
+            reply = ('ok', fn(*args, **kwargs))
+        except BaseException as e:
+            reply = ('error', e)
+        try:
+            task_connection.send(reply)
+        except Exception as e: # Result or exception that can't be pickled
+            task_connection.send(('error', RuntimeError(f"Could not send the result back: {type(e).__name__}: {e}")))
+
+class _WorkerProcess:
+    def __init__(self, mp_context, max_memory_bytes, initializer, initargs):
+        self.connection, child_connection = mp_context.Pipe()
+        self.process = mp_context.Process(target=_worker_main, args=(child_connection, max_memory_bytes, initializer, initargs),
+                                          daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.ready = False
+        self.future = None # Task in progress
+        self.deadline = None
+        self.tasks_done = 0
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+class GuardedPool(Executor):
+    # timeout: seconds a task may run before its worker is killed (the future raises WorkerFailed).
+    # max_memory_bytes: address space limit applied in each worker.
+    # max_tasks_per_worker: replace workers after this many tasks (e.g. to give back fragmented memory).
+    # recycle_if: called in the parent with each successful result; True replaces that worker,
+    # e.g. after a conversion that ran out of memory.
+    # initializer(*initargs) runs once in each new worker, before it takes tasks (e.g. imports).
+    # Workers are spawned by default: they are started from the pool's manager thread, and forking
+    # a multi-threaded process is not safe.
+    def __init__(self, max_workers=None, timeout=None, max_memory_bytes=None, max_tasks_per_worker=None, recycle_if=None,
+                 initializer=None, initargs=(), mp_context=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_memory_bytes = max_memory_bytes
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.recycle_if = recycle_if
+        self.initializer = initializer
+        self.initargs = initargs
+        self._mp_context = mp_context or multiprocessing.get_context('spawn')
+        self._workers = []
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup_reader, self._wakeup_writer = multiprocessing.Pipe(duplex=False)
+        self._shutting_down = False
+        self._manager = None
+        self.stats = {'completed': 0, 'timed_out': 0, 'crashed': 0, 'recycled': 0}
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._shutting_down:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._queue.append((future, fn, args, kwargs))
+            if self._manager is None:
+                self._manager = threading.Thread(target=self._manage, name='msg2eml-guarded-pool', daemon=True)
+                self._manager.start()
+        self._wake_manager()
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._shutting_down = True
+            if cancel_futures:
+                while self._queue:
+                    self._queue.popleft()[0].cancel()
+            manager = self._manager
+        self._wake_manager()
+        if manager is None:
+            self._close_wakeup_pipe()
+        elif wait:
+            manager.join()
+
+    def _wake_manager(self):
+        try:
+            self._wakeup_writer.send_bytes(b'')
+        except OSError:
+            pass
+
+    def _close_wakeup_pipe(self):
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+    # --- Manager thread ---
+    def _manage(self):
+        try:
+            while True:
+                with self._lock:
+                    self._dispatch()
+                    if self._shutting_down and not self._queue and all(worker.future is None for worker in self._workers):
+                        break
+                waitables = [self._wakeup_reader]
+                for worker in self._workers:
+                    waitables.extend((worker.connection, worker.process.sentinel))
+                deadlines = [worker.deadline for worker in self._workers if worker.deadline is not None]
+                wait_seconds = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                for ready in mp_connection.wait(waitables, wait_seconds):
+                    if ready is self._wakeup_reader:
+                        self._wakeup_reader.recv_bytes()
+                for worker in list(self._workers):
+                    self._check_worker(worker)
+        except BaseException as e: # A bug here must not leave callers waiting on their futures forever
+            with self._lock:
+                self._shutting_down = True
+                futures = [queued[0] for queued in self._queue] + [worker.future for worker in self._workers if worker.future is not None]
+                self._queue.clear()
+            for future in futures:
+                if not future.done():
+                    future.set_exception(WorkerFailed('startup', f"The worker pool stopped: {type(e).__name__}: {e}"))
+            raise
+        finally:
+            for worker in self._workers:
+                worker.stop()
+            self._workers.clear()
+            self._close_wakeup_pipe()
+
+    def _dispatch(self):
+        # Hands queued tasks to idle workers, starting workers up to max_workers
+        while len(self._workers) < min(self.max_workers, len(self._queue) + self._busy_workers()):
+            try:
+                self._workers.append(_WorkerProcess(self._mp_context, self.max_memory_bytes, self.initializer, self.initargs))
+            except Exception as e: # e.g. out of processes, or spawning from an unguarded __main__ module
+                future = self._queue.popleft()[0]
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(WorkerFailed('startup', f"A conversion worker could not be started: {type(e).__name__}: {e}"))
+        while self._queue:
+            worker = next((worker for worker in self._workers if worker.ready and worker.future is None), None)
+            if worker is None:
+                return
+            future, fn, args, kwargs = self._queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                worker.connection.send((fn, args, kwargs))
+            except Exception as e: # Arguments that can't be pickled
+                future.set_exception(e)
+                continue
+            worker.future = future
+            worker.deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+
+    def _busy_workers(self):
+        return sum(1 for worker in self._workers if worker.future is not None)
+
+    def _check_worker(self, worker):
+        if not worker.ready and worker.connection.poll():
+            try:
+                worker.ready = worker.connection.recv()[0] == 'ready'
+            except (EOFError, OSError):
+                pass
+        if worker.future is not None and worker.connection.poll():
+            try:
+                status, value = worker.connection.recv()
+            except (EOFError, OSError):
+                pass # Died while sending; handled as a crash below
+            else:
+                future = worker.future
+                worker.future = worker.deadline = None
+                worker.tasks_done += 1
+                self.stats['completed'] += 1
+                if status == 'ok':
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+                recycle = self.max_tasks_per_worker is not None and worker.tasks_done >= self.max_tasks_per_worker
+                if status == 'ok' and self.recycle_if is not None and self.recycle_if(value):
+                    recycle = True
+                if recycle or isinstance(value, MemoryError):
+                    self.stats['recycled'] += 1
+                    self._remove_worker(worker)
+                return
+
+        if not worker.process.is_alive():
+            if not worker.ready:
+                # Failed to start (e.g. a memory limit too low to even import the converter): fail
+                # one waiting task, so a worker that can never start doesn't respawn forever
+                with self._lock:
+                    queued = self._queue.popleft() if self._queue else None
+                if queued is not None and queued[0].set_running_or_notify_cancel():
+                    queued[0].set_exception(WorkerFailed('startup', f"A conversion worker failed to start (exit code {worker.process.exitcode})."))
+            elif worker.future is not None:
+                self.stats['crashed'] += 1
+                worker.future.set_exception(WorkerFailed('crashed', f"The conversion worker exited unexpectedly (exit code {worker.process.exitcode})."))
+            self._remove_worker(worker, kill=True)
+        elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+            self.stats['timed_out'] += 1
+            worker.future.set_exception(WorkerFailed('timeout', f"Conversion did not finish within {self.timeout:g}s; its worker was stopped."))
+            self._remove_worker(worker, kill=True)
+
+    def _remove_worker(self, worker, kill=False):
+        self._workers.remove(worker)
+        worker.stop(kill=kill)
+
+# --- Quarantine list ---
+# The ConversionLimits attribute behind each limit a conversion can hit
+LIMIT_ATTRIBUTES = {
+    'timeout': 'timeout',
+    'memory': 'max_memory_bytes',
+    'attachment_count': 'max_attachments',
+    'attachment_size': 'max_attachment_bytes',
+    'nesting_depth': 'max_nesting_depth',
+}
+# Failures that can come from a busy machine rather than the file itself; a file is only skipped
+# once it has failed this way twice
+TRANSIENT_REASONS = ('timeout', 'crashed')
+
+class Quarantine:
+    # Append-only JSON-lines file, one entry per offending file: source, reason, error, size, mtime,
+    # the limits of the run that recorded it and how often the file has failed for that reason.
+    # limits are those of the current run. An entry applies while the file's size and mtime are
+    # unchanged and the limit it hit is at least as strict now, so a fixed or re-exported file, or a
+    # run with looser limits, tries it again. Timeouts and crashes must also have happened twice.
+    def __init__(self, path, limits=None):
+        self.path = path
+        self.limits = limits
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['source']] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue # A line cut short by an interrupted run
+
+    def get(self, source):
+        # The quarantine entry for source if it still applies, else None
+        entry = self.entries.get(source)
+        if entry is None:
+            return None
+        try:
+            file_stat = os.stat(source)
+        except OSError:
+            return None
+        if (file_stat.st_size, file_stat.st_mtime_ns) != (entry.get('size'), entry.get('mtime_ns')):
+            return None
+        if entry.get('reason') in TRANSIENT_REASONS and entry.get('failures', 1) < 2:
+            return None
+        limit_attribute = LIMIT_ATTRIBUTES.get(entry.get('reason'))
+        if limit_attribute is not None:
+            recorded_limit = (entry.get('limits') or {}).get(limit_attribute)
+            current_limit = getattr(self.limits, limit_attribute, None)
+            if recorded_limit is None or current_limit is None or current_limit > recorded_limit:
+                return None # Looser than when the file failed (or no limit at all): worth another try
+        return entry
+
+    def add(self, source, reason, error):
+        try:
+            file_stat = os.stat(source)
+            size, mtime_ns = file_stat.st_size, file_stat.st_mtime_ns
+        except OSError:
+            size = mtime_ns = None
+        previous = self.entries.get(source)
+        repeated = previous is not None and (previous.get('reason'), previous.get('size'), previous.get('mtime_ns')) == (reason, size, mtime_ns)
+        entry = {'source': source, 'reason': reason, 'error': error, 'size': size, 'mtime_ns': mtime_ns,
+                 'limits': dict(vars(self.limits)) if self.limits is not None else None,
+                 'failures': previous.get('failures', 1) + 1 if repeated else 1,
+                 'quarantined_at': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.entries[source] = entry
+        return entry
@@ -0,0 +1,53 @@
+# conversion_metrics.py
+import json
+
+class ConversionMetrics:
+    # Collects the per-stage events that msg_converter_core reports through metrics_callback:
+    #
+    #   metrics = ConversionMetrics()
+    #   msg_converter_core.convert_msg_to_eml_stream(path, out, stem, metrics_callback=metrics)
+    #   metrics.stage_totals()  -> {'ole_parse': {'count': 1, 'seconds': 0.012, 'bytes': 48128}, ...}
+    #
+    # Stages: ole_parse (the OLE directory and message properties), attachment_load (per message,
+    # reading its attachments' data), headers, body, attachment (per attachment, building the part),
+    # nested_message (per nested MSG, inclusive of its own stages), attachment_encode (per lazily
+    # encoded attachment, during serialization), serialize (inclusive of attachment_encode)
+    # and conversion (the whole call, with its status).
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {}) # Added to every exported record, e.g. {'source': path}
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def stage_totals(self):
+        totals = {}
+        for event in self.events:
+            stage_total = totals.setdefault(event['stage'], {'count': 0, 'seconds': 0.0, 'bytes': 0})
+            stage_total['count'] += 1
+            stage_total['seconds'] += event.get('seconds', 0.0)
+            for bytes_field in ('bytes', 'input_bytes', 'output_bytes'):
+                if event.get(bytes_field):
+                    stage_total['bytes'] += event[bytes_field]
+        return totals
+
+    def slowest(self, stage, count=5):
+        stage_events = [event for event in self.events if event['stage'] == stage]
+        return sorted(stage_events, key=lambda event: event.get('seconds', 0.0), reverse=True)[:count]
+
+    def total_seconds(self):
+        for event in reversed(self.events):
+            if event['stage'] == 'conversion':
+                return event['seconds']
+        return None
+
+    def to_records(self):
+        return [dict(self.labels, **event) for event in self.events]
+
+    def write_json_lines(self, fp):
+        # One JSON object per event, ready for a log shipper / metrics pipeline
+        for record in self.to_records():
+            fp.write(json.dumps(record, default=str) + '\n')
+
+    def clear(self):
+        self.events.clear()
@@ -0,0 +1,380 @@
+# conversion_server.py
+# Headless HTTP endpoint for pipeline integration (no Streamlit involved):
+#
+#   python conversion_server.py --port 8502 --workers 4
+#   curl --data-binary @mail.msg "http://localhost:8502/convert?filename=mail.msg" -o mail.eml
+#   curl -F "file=@mail.msg" http://localhost:8502/convert -o mail.eml
+#
+# POST /convert takes the MSG either as the raw request body or as the first file of a
+# multipart/form-data upload, and streams the EML back (chunked). GET /healthz reports load.
+# The asyncio front end only parses HTTP and shovels bytes: the request body is spooled to a temp
+# file and the worker gets its path, so uploads waiting for a worker are not held in memory.
+# Conversions run on a watched process pool (conversion_guard.GuardedPool), so a conversion that
+# hangs or crashes its worker only fails that request (422, with the limit in X-Conversion-Limit).
+# At most `workers` conversions run at once and at most `queue_limit` more wait for a worker;
+# anything beyond that is turned away with 429 before its upload is read, and 503 is returned
+# while the server is shutting down.
+import argparse
+import asyncio
+import email.feedparser
+import email.policy
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import traceback
+from http import HTTPStatus
+from urllib.parse import parse_qs, quote, urlsplit
+
+import msg_converter_core # Import our conversion logic
+import conversion_guard
+from conversion_metrics import ConversionMetrics
+
+STREAM_CHUNK_BYTES = 256 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+
+# --- Worker (runs in a child process) ---
+class UploadError(ValueError):
+    # The request body holds no MSG to convert (answered with 400)
+    pass
+
+def read_upload(upload_path, content_type, default_filename):
+    # Returns (MSG path or bytes, original filename). A raw body is converted straight from the
+    # spooled file; for a multipart/form-data upload the first file part is extracted.
+    if not content_type.lower().startswith('multipart/form-data'):
+        return upload_path, default_filename
+    parser = email.feedparser.BytesFeedParser(policy=email.policy.HTTP)
+    parser.feed(f"Content-Type: {content_type}\r\n\r\n".encode('latin-1'))
+    with open(upload_path, 'rb') as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    form = parser.close()
+    for part in form.iter_parts() if form.is_multipart() else []:
+        if part.get_filename():
+            # Browsers send the name as raw UTF-8, which the parser keeps as surrogate escapes
+            filename = part.get_filename().encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
+            return part.get_payload(decode=True), filename
+    raise UploadError("No file found in the multipart upload.")
+
+def convert_upload(upload_path, content_type, default_filename, output_path, limits=None):
+    # Returns (bytes_written, suggested_filename, error, limit hit)
+    msg_source, upload_filename = read_upload(upload_path, content_type, default_filename)
+    stem = os.path.splitext(os.path.basename(upload_filename))[0] or 'converted'
+    logs = []
+    metrics = ConversionMetrics() if limits is not None else None # Reports which limit was hit
+    bytes_written, suggested_filename = msg_converter_core.convert_msg_to_eml_stream(
+        msg_source, output_path, stem, log_callback=logs.append, metrics_callback=metrics,
+        **(limits.converter_kwargs() if limits is not None else {})
+    )
+    if bytes_written is None:
+        return None, None, logs[-1] if logs else "Conversion failed.", conversion_guard.failed_limit(metrics)
+    return bytes_written, suggested_filename, None, None
+
+def content_disposition(filename):
+    # RFC 6266: an ASCII filename for old clients, plus the real name as UTF-8 in filename* when
+    # it isn't plain ASCII (header values must stay latin-1 encodable)
+    ascii_filename = ''.join(c if ' ' <= c <= '~' and c not in '"\\' else '_' for c in filename)
+    if ascii_filename == filename:
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename=\"{ascii_filename}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+# --- Request parsing ---
+class HTTPError(Exception):
+    def __init__(self, status, message=None, headers=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+        self.headers = headers or {}
+
+async def read_request_head(reader):
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+    except asyncio.IncompleteReadError:
+        return None # Client went away before sending a full request
+    request_line, *header_lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = request_line.split(' ', 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+    headers = {}
+    for header_line in header_lines:
+        if ':' in header_line:
+            name, value = header_line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method.upper(), target, headers
+
+# --- Server ---
+class ConversionServer:
+    def __init__(self, host='127.0.0.1', port=8502, workers=None, queue_limit=None, max_upload_bytes=200 * 1024 * 1024,
+                 request_timeout=60.0, executor=None, limits=None):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = queue_limit if queue_limit is not None else self.workers * 4
+        self.max_upload_bytes = max_upload_bytes
+        self.request_timeout = request_timeout
+        self.limits = limits # conversion_guard.ConversionLimits
+        self._executor = executor # Pass a ThreadPoolExecutor to run everything in-process (tests)
+        self._owns_executor = executor is None
+        self._worker_slots = None
+        self._admitted = 0 # Requests holding or waiting for a worker slot
+        self._responses_started = set() # Writers that already got a response head; too late for an error response
+        self._accepting = False
+        self._server = None
+        self._output_dir = None
+        self.stats = {'converted': 0, 'failed': 0, 'over_limit': 0, 'rejected_busy': 0, 'rejected_unavailable': 0}
+
+    async def start(self):
+        if self._executor is None:
+            limits = self.limits or conversion_guard.ConversionLimits()
+            self._executor = conversion_guard.GuardedPool(max_workers=self.workers, timeout=limits.timeout,
+                                                          max_memory_bytes=limits.max_memory_bytes,
+                                                          recycle_if=lambda result: result[3] == 'memory',
+                                                          initializer=msg_converter_core.prewarm)
+        self._worker_slots = asyncio.Semaphore(self.workers)
+        self._output_dir = tempfile.mkdtemp(prefix='msg2eml-server-')
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1] # Resolves port=0 to the actual port
+        self._accepting = True
+        return self.port
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._accepting = False
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self._output_dir:
+            shutil.rmtree(self._output_dir, ignore_errors=True)
+
+    def health(self):
+        return {
+            'status': 'ok' if self._accepting else 'shutting_down',
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'in_flight': self._admitted,
+            **self.stats,
+            'pool': dict(getattr(self._executor, 'stats', {})), # Timed out / crashed / recycled workers
+        }
+
+    # --- Connection handling ---
+    async def _handle_connection(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(read_request_head(reader), self.request_timeout)
+            if request is not None:
+                await self._dispatch(reader, writer, *request)
+        except HTTPError as e:
+            await self._send_simple(writer, e.status, str(e), e.headers)
+        except asyncio.TimeoutError:
+            await self._send_simple(writer, HTTPStatus.REQUEST_TIMEOUT, "Request timed out.")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass # Client disconnected; nothing to answer
+        except Exception as e: # A bug in the server must still get an answer, not a silent disconnect
+            traceback.print_exc()
+            if writer not in self._responses_started:
+                await self._send_simple(writer, HTTPStatus.INTERNAL_SERVER_ERROR, f"Internal server error: {type(e).__name__}")
+        finally:
+            self._responses_started.discard(writer)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _dispatch(self, reader, writer, method, target, headers):
+        url = urlsplit(target)
+        if url.path == '/healthz' and method == 'GET':
+            await self._send_simple(writer, HTTPStatus.OK, json.dumps(self.health()), content_type='application/json')
+        elif url.path == '/convert':
+            if method != 'POST':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, headers={'Allow': 'POST'})
+            await self._handle_convert(reader, writer, headers, parse_qs(url.query))
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    async def _handle_convert(self, reader, writer, headers, query):
+        # Admission control happens before the body is read, so rejected clients don't upload
+        if not self._accepting:
+            self.stats['rejected_unavailable'] += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Server is shutting down.", {'Retry-After': '5'})
+        if self._admitted >= self.workers + self.queue_limit:
+            self.stats['rejected_busy'] += 1
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "Too many conversions in progress, retry later.", {'Retry-After': '1'})
+        if 'content-length' not in headers:
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED)
+        try:
+            content_length = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.")
+        if content_length > self.max_upload_bytes:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Uploads are limited to {self.max_upload_bytes} bytes.")
+
+        self._admitted += 1
+        request_path = os.path.join(self._output_dir, f"{os.getpid()}-{id(writer)}-{time.monotonic_ns()}")
+        upload_path, output_path = f"{request_path}.msg", f"{request_path}.eml"
+        try:
+            if headers.get('expect', '').lower() == '100-continue':
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                await writer.drain()
+            await asyncio.wait_for(self._spool_body(reader, content_length, upload_path), self.request_timeout)
+            default_filename = query.get('filename', ['upload.msg'])[0]
+
+            async with self._worker_slots:
+                try:
+                    bytes_written, suggested_filename, error, limit = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, convert_upload, upload_path, headers.get('content-type', ''), default_filename,
+                        output_path, self.limits)
+                except conversion_guard.WorkerFailed as e:
+                    if e.reason == 'startup':
+                        self.stats['failed'] += 1
+                        raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {'Retry-After': '5'})
+                    bytes_written, error, limit = None, str(e), e.reason
+                except UploadError as e:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+                except Exception as e: # A converter bug must still get an answer, not a dropped connection
+                    self.stats['failed'] += 1
+                    raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, f"Conversion failed: {str(e) or type(e).__name__}")
+            if bytes_written is None:
+                self.stats['failed'] += 1
+                if limit is not None:
+                    self.stats['over_limit'] += 1
+                    raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, error, {'X-Conversion-Limit': limit})
+                raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, error)
+            self.stats['converted'] += 1
+            await self._stream_file(writer, output_path, suggested_filename)
+        finally:
+            self._admitted -= 1
+            for path in (upload_path, output_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    async def _spool_body(self, reader, content_length, upload_path):
+        with open(upload_path, 'wb') as f:
+            remaining = content_length
+            while remaining:
+                chunk = await reader.read(min(remaining, STREAM_CHUNK_BYTES))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                f.write(chunk)
+                remaining -= len(chunk)
+
+    # --- Responses ---
+    async def _stream_file(self, writer, path, download_name):
+        self._write_response(writer, HTTPStatus.OK, {
+            'Content-Type': 'message/rfc822',
+            'Content-Disposition': content_disposition(download_name),
+            'Transfer-Encoding': 'chunked',
+        })
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                writer.write(f"{len(chunk):X}\r\n".encode('ascii') + chunk + b'\r\n')
+                await writer.drain() # Backpressure: don't outrun slow clients
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def _send_simple(self, writer, status, text, extra_headers=None, content_type='text/plain; charset=utf-8'):
+        body = (text if text.endswith('\n') else text + '\n').encode('utf-8')
+        headers = {'Content-Type': content_type, 'Content-Length': str(len(body))}
+        headers.update(extra_headers or {})
+        try:
+            self._write_response(writer, status, headers, body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def _write_response(self, writer, status, headers, body=b''):
+        head = self._response_head(status, headers) # Encoded first, so a bad header can still be answered with a 500
+        self._responses_started.add(writer)
+        writer.write(head + body)
+
+    def _response_head(self, status, headers):
+        status = HTTPStatus(status)
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}", 'Connection: close']
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+# --- Minimal client (for tests and scripts) ---
+async def send_request(host, port, method, target, body=b'', headers=None):
+    # Returns (status, headers, body); handles chunked responses
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request_headers = {'Host': f"{host}:{port}", 'Content-Length': str(len(body)), 'Connection': 'close'}
+        request_headers.update(headers or {})
+        head = f"{method} {target} HTTP/1.1\r\n" + ''.join(f"{k}: {v}\r\n" for k, v in request_headers.items()) + "\r\n"
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+        response_head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+        status_line, *header_lines = response_head.split('\r\n')
+        status = int(status_line.split(' ')[1])
+        response_headers = {}
+        for header_line in header_lines:
+            if ':' in header_line:
+                name, value = header_line.split(':', 1)
+                response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+                if size == 0:
+                    await reader.readuntil(b'\r\n')
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            response_body = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            response_body = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            response_body = await reader.read()
+        return status, response_headers, response_body
+    finally:
+        writer.close()
+
+async def post_msg(host, port, msg_bytes, filename='upload.msg'):
+    return await send_request(host, port, 'POST', f"/convert?filename={quote(filename)}", msg_bytes,
+                              {'Content-Type': 'application/vnd.ms-outlook'})
+
+# --- Entry point ---
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Serve MSG to EML conversion over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to bind (default: 127.0.0.1).")
+    parser.add_argument('--port', type=int, default=8502, help="Port to listen on (default: 8502).")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Conversion worker processes. Defaults to the number of CPU cores.")
+    parser.add_argument('--queue-limit', type=int, default=None, help="Conversions allowed to wait for a worker before new ones get 429 (default: 4 per worker).")
+    parser.add_argument('--max-upload-mb', type=int, default=200, help="Largest accepted upload in MB (default: 200).")
+    conversion_guard.add_limit_arguments(parser)
+    return parser
+
+async def run_server(args):
+    server = ConversionServer(args.host, args.port, workers=args.workers, queue_limit=args.queue_limit,
+                              max_upload_bytes=args.max_upload_mb * 1024 * 1024, limits=conversion_guard.limits_from_args(args))
+    port = await server.start()
+    print(f"Serving MSG to EML conversion on http://{args.host}:{port} with {server.workers} worker(s)")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support() # Needed for the process pool in a PyInstaller build
+    try:
+        asyncio.run(run_server(build_arg_parser().parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,224 @@
+# mbox_export.py
+# Writes converted messages into a single mbox file (mboxrd flavour), streamed message by message:
+#
+#   with mbox_export.open_mbox('custodian.mbox.gz') as mbox:
+#       for msg_path in msg_paths:
+#           mbox.start_message()
+#           bytes_written, _ = msg_converter_core.convert_msg_to_eml_stream(msg_path, mbox, 'unused', log_callback=None)
+#           if bytes_written is not None:
+#               mbox.end_message()
+#           else:
+#               mbox.abort_message() # Takes back whatever the failed conversion wrote
+#
+# mboxrd escaping: any line matching ">*From " inside a message gets one more ">" so readers can
+# split messages unambiguously and un-escape losslessly. The escaping is done on the fly, so a
+# message never has to be held in memory.
+# Workers in other processes can't write into the mbox; their finished temp .eml files are
+# copied in with append_eml_file().
+import bz2
+import gzip
+import lzma
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+_FROM_LINE = re.compile(rb'^(>*From )', re.MULTILINE)
+COPY_CHUNK_BYTES = 1024 * 1024
+# A spooled message (compressed output only) stays in memory up to this size, then goes to a temp file
+SPOOL_MEMORY_BYTES = 16 * 1024 * 1024
+
+# Compression is picked from the output file extension
+COMPRESSED_OPENERS = {
+    '.gz': lambda fp: gzip.GzipFile(fileobj=fp, mode='wb', compresslevel=6), # Level 9 is much slower for ~1% smaller mail archives
+    '.bz2': lambda fp: bz2.BZ2File(fp, mode='wb'),
+    '.xz': lambda fp: lzma.LZMAFile(fp, mode='wb'),
+}
+
+def mbox_separator_line(sender='MAILER-DAEMON', timestamp=None):
+    return f"From {sender} {time.asctime(time.gmtime(timestamp))}\n".encode('ascii')
+
+def _could_become_from_line(line_start):
+    # True while an incomplete line could still turn into ">*From " with the next chunk
+    return b'From '.startswith(line_start.lstrip(b'>'))
+
+class MboxWriter:
+    # File-like sink for one message at a time: start_message(), write() the EML bytes, then
+    # end_message(), or abort_message() to take back a message whose conversion failed halfway.
+    # The separator line is only written once the message's first bytes arrive, so a conversion that
+    # fails before producing output leaves no trace in the mbox.
+    # abort_message() truncates fp back to where the message started, so fp must be seekable. A
+    # compressed stream can't be truncated: with spool_messages=True each message is written to a
+    # spool file instead and only copied to fp by end_message().
+    def __init__(self, fp, spool_messages=False):
+        self._out = fp
+        self._fp = fp # Where the current message goes: fp itself, or the spool
+        self._spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES) if spool_messages else None
+        self._message_start = None # Offset in fp to truncate back to, for an unspooled message
+        self._separator = None
+        self._carry = b'' # Start of the current line, held back until we know if it needs escaping
+        self._mid_line = False # The current line has already been written out (and escaped if needed)
+        self._ends_with_newline = True
+        self.message_bytes = 0 # Bytes of the current message written so far
+        self.message_count = 0
+
+    def start_message(self, sender='MAILER-DAEMON', timestamp=None, rollback=True):
+        # rollback=False writes straight to fp even when spooling, for data that can't fail halfway
+        # (e.g. a finished .eml); abort_message() can't take such a message back
+        self._separator = mbox_separator_line(sender, timestamp)
+        self._carry = b''
+        self._mid_line = False
+        self.message_bytes = 0
+        self._message_start = None
+        if rollback and self._spool is not None:
+            self._fp = self._spool
+            self._reset_spool()
+        else:
+            self._fp = self._out
+            if rollback:
+                self._message_start = self._out.tell()
+
+    def write(self, data):
+        if not data:
+            return 0
+        if self._separator is not None:
+            self._fp.write(self._separator)
+            self._separator = None
+        self.message_bytes += len(data)
+        data_length = len(data)
+        if self._carry:
+            data = self._carry + data
+            self._carry = b''
+        if b'From ' not in data:
+            # Nothing to escape (always the case for base64 chunks), so the data is passed through
+            # uncopied; only an unfinished last line that might still become a "From " is held back
+            last_newline = data.rfind(b'\n')
+            if last_newline == -1 and self._mid_line:
+                self._emit(data)
+                return data_length
+            tail = data[last_newline + 1:]
+            if tail and _could_become_from_line(tail):
+                if last_newline != -1:
+                    self._emit(data[:last_newline + 1])
+                self._carry = tail
+                self._mid_line = False
+            else:
+                self._emit(data)
+                self._mid_line = bool(tail)
+            return data_length
+        start = 0
+        if self._mid_line: # Finish the current line as-is
+            newline = data.find(b'\n')
+            if newline == -1:
+                self._emit(data)
+                return data_length
+            self._emit(data[:newline + 1])
+            start = newline + 1
+            self._mid_line = False
+        last_newline = data.rfind(b'\n', start)
+        if last_newline != -1: # Complete lines, each starting at a line start
+            complete_lines = data[start:last_newline + 1]
+            if b'From ' in complete_lines:
+                complete_lines = _FROM_LINE.sub(rb'>\1', complete_lines)
+            self._emit(complete_lines)
+            start = last_newline + 1
+        tail = data[start:]
+        if tail:
+            if _FROM_LINE.match(tail):
+                self._emit(b'>' + tail)
+                self._mid_line = True
+            elif _could_become_from_line(tail):
+                self._carry = bytes(tail)
+            else:
+                self._emit(tail)
+                self._mid_line = True
+        return data_length
+
+    def end_message(self):
+        # Returns True if the message produced any output (and was terminated in the mbox)
+        self._separator = None
+        if self._carry:
+            self._emit(self._carry)
+            self._carry = b''
+        if not self.message_bytes:
+            return False
+        self._fp.write(b'\n\n' if not self._ends_with_newline else b'\n') # Messages are followed by a blank line
+        self._ends_with_newline = True
+        self._mid_line = False
+        if self._fp is self._spool:
+            self._spool.seek(0)
+            shutil.copyfileobj(self._spool, self._out, COPY_CHUNK_BYTES)
+            self._reset_spool()
+            self._fp = self._out
+        self.message_count += 1
+        return True
+
+    def abort_message(self):
+        # Takes back everything written since start_message(), as if the message had never started
+        self._separator = None
+        self._carry = b''
+        self._mid_line = False
+        self._ends_with_newline = True # Every message, and the mbox itself, starts at a line start
+        self.message_bytes = 0
+        if self._fp is self._spool:
+            self._reset_spool()
+            self._fp = self._out
+        elif self._message_start is not None:
+            self._out.seek(self._message_start)
+            self._out.truncate()
+        self._message_start = None
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+
+    def _reset_spool(self):
+        self._spool.seek(0)
+        self._spool.truncate()
+
+    def append_eml_file(self, eml_path, sender='MAILER-DAEMON', timestamp=None):
+        # Copies an already converted .eml into the mbox in chunks
+        self.start_message(sender, timestamp, rollback=False)
+        with open(eml_path, 'rb') as f:
+            while True:
+                chunk = f.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                self.write(chunk)
+        return self.end_message()
+
+    def _emit(self, data):
+        self._fp.write(data)
+        self._ends_with_newline = data.endswith(b'\n')
+
+@contextmanager
+def open_mbox(mbox_path):
+    # Yields an MboxWriter. The mbox is written to a temp file next to mbox_path and only renamed
+    # into place once complete, so an interrupted run never leaves a truncated archive behind.
+    # A .gz/.bz2/.xz extension compresses the output on the fly.
+    mbox_dir, mbox_name = os.path.split(os.path.abspath(mbox_path))
+    os.makedirs(mbox_dir, exist_ok=True)
+    temp_path = os.path.join(mbox_dir, f".{mbox_name}.{os.getpid()}.tmp")
+    # Created like a regular file (honouring the umask), unlike tempfile.mkstemp's owner-only mode
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with open(fd, 'wb', buffering=COPY_CHUNK_BYTES) as raw_fp:
+            opener = COMPRESSED_OPENERS.get(os.path.splitext(mbox_path)[1].lower())
+            if opener is None:
+                mbox = MboxWriter(raw_fp)
+            else:
+                compressed_fp = opener(raw_fp)
+                mbox = MboxWriter(compressed_fp, spool_messages=True)
+            try:
+                yield mbox
+            finally:
+                mbox.close()
+                if opener is not None:
+                    compressed_fp.close()
+        os.replace(temp_path, mbox_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
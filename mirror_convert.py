@@ -0,0 +1,190 @@
+# mirror_convert.py
+# Incremental, resumable mirror of an MSG tree as EMLs, for nightly jobs:
+#
+#   python mirror_convert.py path/to/export -o path/to/eml_mirror
+#
+# A manifest (SQLite, in the output directory) records for every source file its size, mtime,
+# SHA-256 and output path once its EML is safely in place. A re-run only stats the tree: files
+# whose size and mtime match the manifest are skipped without being read; files whose stat changed
+# but whose content hash did not (e.g. touched or copied) just get their manifest entry refreshed.
+# Each EML is written to a .partial file and renamed into place, and its manifest row is committed
+# right after, so an interrupted run resumes where it stopped and never leaves half-written EMLs.
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import batch_convert
+from conversion_cache import CACHE_KEY_VERSION
+
+MANIFEST_FILENAME = '.msg2eml-manifest.sqlite'
+# Entries written by a converter with different output are reconverted
+CONVERTER_VERSION = CACHE_KEY_VERSION.decode('ascii')
+HASH_CHUNK_BYTES = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    source TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    output TEXT NOT NULL,
+    status TEXT NOT NULL,
+    converter_version TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+class ConversionManifest:
+    # Source and output paths are stored relative to the input and output roots, so both trees can
+    # be moved together without invalidating the manifest
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+
+    def entries(self):
+        columns = ('source', 'size', 'mtime_ns', 'sha256', 'output', 'status', 'converter_version')
+        return {row[0]: dict(zip(columns, row)) for row in
+                self._connection.execute(f"SELECT {', '.join(columns)} FROM manifest")}
+
+    def record(self, source, size, mtime_ns, sha256, output, status):
+        with self._connection: # Committed immediately: this is the resume point
+            self._connection.execute(
+                'INSERT OR REPLACE INTO manifest (source, size, mtime_ns, sha256, output, status, converter_version, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (source, size, mtime_ns, sha256, output, status, CONVERTER_VERSION, time.time()))
+
+    def remove(self, source):
+        with self._connection:
+            self._connection.execute('DELETE FROM manifest WHERE source = ?', (source,))
+
+    def close(self):
+        self._connection.close()
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# --- Worker (runs in a child process) ---
+def mirror_one_file(msg_path, eml_path, known_sha256=None, retries=0):
+    # Hashes the MSG and converts it unless its content matches known_sha256 and the EML exists.
+    # Returns a batch_convert-style result dict plus 'size', 'mtime_ns' and 'sha256'.
+    started = time.perf_counter()
+    try:
+        file_stat = os.stat(msg_path) # Taken before reading: a file changed mid-run is caught next time
+        sha256 = file_sha256(msg_path)
+    except OSError as e:
+        result = batch_convert.new_result(msg_path, eml_path)
+        result.update(error=f"Could not read MSG file: {e}", size=None, mtime_ns=None, sha256=None)
+        return result
+
+    if sha256 == known_sha256 and os.path.exists(eml_path):
+        result = batch_convert.new_result(msg_path, eml_path)
+        result.update(status='skipped', input_bytes=file_stat.st_size, output_bytes=os.path.getsize(eml_path))
+    else:
+        partial_path = f"{eml_path}.partial"
+        result = batch_convert.convert_one_file(msg_path, partial_path, retries=retries)
+        if result['status'] == 'converted':
+            os.replace(partial_path, eml_path) # Atomic: readers see the old EML or the new one, never a mix
+        result['output'] = eml_path
+    result.update(size=file_stat.st_size, mtime_ns=file_stat.st_mtime_ns, sha256=sha256)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+# --- Mirror driver ---
+def mirror_directory(input_dir, output_dir, jobs=None, retries=0, delete=False, log_callback=print):
+    # Returns (results, summary) like batch_convert.convert_directory; results only cover files
+    # that had to be hashed or converted.
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = ConversionManifest(os.path.join(output_dir, MANIFEST_FILENAME))
+    try:
+        entries = manifest.entries()
+        msg_paths = batch_convert.find_msg_files(input_dir)
+        started = time.perf_counter()
+
+        tasks = []
+        unchanged = 0
+        seen_sources = set()
+        # Sources whose names sanitize to the same .eml get distinct outputs (see output_paths_for)
+        for msg_path, eml_path in zip(msg_paths, batch_convert.output_paths_for(msg_paths, input_dir, output_dir)):
+            source = os.path.relpath(msg_path, input_dir)
+            seen_sources.add(source)
+            entry = entries.get(source)
+            reusable = (entry is not None and entry['status'] == 'converted' and entry['converter_version'] == CONVERTER_VERSION
+                        and entry['output'] == os.path.relpath(eml_path, output_dir))
+            if reusable:
+                try:
+                    file_stat = os.stat(msg_path)
+                except OSError:
+                    file_stat = None
+                if (file_stat is not None and (file_stat.st_size, file_stat.st_mtime_ns) == (entry['size'], entry['mtime_ns'])
+                        and os.path.exists(eml_path)):
+                    unchanged += 1
+                    continue
+            tasks.append((msg_path, eml_path, entry['sha256'] if reusable else None, retries))
+
+        removed = 0
+        if delete:
+            for source in set(entries) - seen_sources:
+                stale_output = os.path.join(output_dir, entries[source]['output'])
+                if os.path.exists(stale_output):
+                    os.remove(stale_output)
+                manifest.remove(source)
+                removed += 1
+
+        jobs = jobs or os.cpu_count() or 1
+        log_callback(f"Found {len(msg_paths)} .msg file(s) under '{input_dir}': {unchanged} unchanged, "
+                     f"{len(tasks)} new or modified{f', {removed} removed' if delete else ''}.")
+        results = []
+        if tasks:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+                for index, result in enumerate(batch_convert.map_in_order(executor, mirror_one_file, tasks, window=jobs * 4)):
+                    if result['status'] != 'failed' or result['sha256'] is not None:
+                        manifest.record(os.path.relpath(result['source'], input_dir), result['size'], result['mtime_ns'],
+                                        result['sha256'], os.path.relpath(result['output'], output_dir),
+                                        'converted' if result['status'] != 'failed' else 'failed')
+                    results.append(result)
+                    batch_convert.log_result(log_callback, index, len(tasks), result)
+        summary = batch_convert.summarize_results(results, time.perf_counter() - started)
+        summary['unchanged'] = unchanged
+        summary['removed'] = removed
+        return results, summary
+    finally:
+        manifest.close()
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Keep a directory of .eml files in sync with a tree of .msg files, converting only new or changed files.")
+    parser.add_argument('input_dir', help="Directory to search (recursively) for .msg files.")
+    parser.add_argument('-o', '--output-dir', help="Mirror directory (holds the manifest too). Defaults to '<input_dir>_eml'.")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes. Defaults to the number of CPU cores.")
+    parser.add_argument('--retries', type=int, default=0, help="Retry a failed file this many times before skipping it (default: 0).")
+    parser.add_argument('--delete', action='store_true', help="Delete the .eml of source files that no longer exist.")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    input_dir = os.path.abspath(args.input_dir)
+    if not os.path.isdir(input_dir):
+        print(f"Error: input directory not found: {args.input_dir}")
+        return 2
+    output_dir = os.path.abspath(args.output_dir or f"{input_dir.rstrip(os.sep)}_eml")
+    _, summary = mirror_directory(input_dir, output_dir, jobs=args.jobs, retries=max(0, args.retries), delete=args.delete)
+    print(f"{summary['unchanged']} file(s) unchanged, {summary['removed']} removed. " + batch_convert.format_summary(summary))
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support() # Needed for the process pool in a PyInstaller build
+    sys.exit(main())
@@ -1,6 +1,5 @@
 # msg_converter_core.py
 
-import extract_msg
 import os
 import re
 import email
@@ -10,10 +9,54 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email.mime.message import MIMEMessage
 from email.header import Header
-from email import encoders
 from email import utils as email_utils 
+from email.generator import BytesGenerator
+import binascii
+import hashlib
 import mimetypes
+import threading
 import time
+from io import BytesIO
+from collections import Counter, OrderedDict, defaultdict
+
+# --- Lazy extract-msg import ---
+# extract-msg pulls in a large dependency tree (~0.3s to import), so it is imported on first use
+# rather than with this module. start_prewarm() imports it on a background thread instead, so an
+# app can draw its first page while the import runs.
+_extract_msg = None
+_extract_msg_lock = threading.Lock()
+PREWARM_TIMINGS = {} # Stage name -> seconds, filled in by prewarm()
+
+def load_extract_msg():
+    global _extract_msg
+    if _extract_msg is None:
+        with _extract_msg_lock:
+            if _extract_msg is None:
+                started = time.perf_counter()
+                import extract_msg
+                PREWARM_TIMINGS.setdefault('extract_msg_import', time.perf_counter() - started)
+                _extract_msg = extract_msg
+    return _extract_msg
+
+def prewarm():
+    # Pays the one-off costs of the first conversion up front: the extract-msg import and the
+    # mimetypes database (read from disk on the first guess_type call)
+    load_extract_msg()
+    started = time.perf_counter()
+    mimetypes.init()
+    PREWARM_TIMINGS.setdefault('mimetypes_init', time.perf_counter() - started)
+    return PREWARM_TIMINGS
+
+def start_prewarm(log_callback=None):
+    def run_prewarm():
+        started = time.perf_counter()
+        timings = prewarm()
+        if log_callback:
+            details = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items())
+            log_callback(f"Converter prewarmed in {time.perf_counter() - started:.2f}s ({details})")
+    prewarm_thread = threading.Thread(target=run_prewarm, name='msg2eml-prewarm', daemon=True)
+    prewarm_thread.start()
+    return prewarm_thread
 
 # --- Helper Functions (sanitize_filename, guess_mimetype) ---
 def sanitize_filename(filename_str, default_name="unnamed_file"):
@@ -33,18 +76,206 @@ def guess_mimetype(filename):
         return m_type.split('/', 1)
     return 'application', 'octet-stream'
 
+# --- Lazy Base64 Attachment Parts ---
+BASE64_LINE_BYTES = 57 # 57 raw bytes encode to exactly one 76-character base64 line
+BASE64_CHUNK_BYTES = BASE64_LINE_BYTES * 8192 # ~456 KB raw / ~623 KB encoded per chunk
+
+def encode_base64_lines(raw_chunk):
+    # Same bytes as base64.encodebytes(raw_chunk), but one b2a_base64 call for the whole chunk
+    # instead of one per line; the newlines are spliced in with 77 strided slice copies.
+    encoded = binascii.b2a_base64(raw_chunk, newline=False)
+    full_lines, tail_len = divmod(len(encoded), 76)
+    encoded_lines = bytearray(full_lines * 77)
+    full_part = encoded[:full_lines * 76]
+    for column in range(76):
+        encoded_lines[column::77] = full_part[column::76]
+    encoded_lines[76::77] = b'\n' * full_lines
+    if tail_len:
+        encoded_lines += encoded[full_lines * 76:] + b'\n'
+    return encoded_lines
+
+class LazyBase64Part(MIMEBase):
+    # A base64 attachment part that keeps a reference to its source (bytes-like object or a
+    # readable binary file object) and only encodes it, chunk by chunk, when it is serialized.
+    # StreamingBytesGenerator writes the chunks straight to the output; anything else that asks
+    # for the payload (as_bytes(), get_payload()) gets the fully encoded string as before.
+    # Structural checks (is_multipart(), and so walk()) answer without encoding anything.
+    _source_data = None
+
+    def __init__(self, _maintype, _subtype, source_data, **_params):
+        MIMEBase.__init__(self, _maintype, _subtype, **_params)
+        self['Content-Transfer-Encoding'] = 'base64'
+        self._source_data = source_data
+
+    def raw_size(self):
+        source = self._source_data
+        if hasattr(source, 'read'):
+            return source.seek(0, os.SEEK_END)
+        return memoryview(source).nbytes
+
+    def iter_raw_chunks(self, chunk_size=BASE64_CHUNK_BYTES):
+        source = self._source_data
+        if hasattr(source, 'read'):
+            source.seek(0)
+            while True:
+                raw_chunk = source.read(chunk_size)
+                if not raw_chunk:
+                    return
+                yield raw_chunk
+        else:
+            source_view = memoryview(source)
+            for offset in range(0, len(source_view), chunk_size):
+                yield source_view[offset:offset + chunk_size]
+
+    def iter_encoded_chunks(self, chunk_size=BASE64_CHUNK_BYTES):
+        # chunk_size must be a multiple of 57 so that every chunk ends on a line break;
+        # the concatenated chunks are then exactly what encoders.encode_base64 produces.
+        for raw_chunk in self.iter_raw_chunks(chunk_size):
+            yield encode_base64_lines(raw_chunk)
+
+    def is_multipart(self):
+        # Message.is_multipart() would read _payload, i.e. encode the whole attachment
+        if self._source_data is None:
+            return isinstance(self._materialized_payload, list)
+        return False
+
+    @property
+    def _payload(self):
+        if self._source_data is None:
+            return self._materialized_payload
+        return b''.join(self.iter_encoded_chunks()).decode('ascii')
+
+    @_payload.setter
+    def _payload(self, value):
+        # set_payload() (and Message.__init__) replace the lazy source with a regular payload
+        self._source_data = None
+        self._materialized_payload = value
+
+def raw_sha256(part):
+    digest = hashlib.sha256()
+    for raw_chunk in part.iter_raw_chunks():
+        digest.update(raw_chunk)
+    return digest.digest()
+
+def base64_encoded_size(raw_size):
+    full_lines, tail_bytes = divmod(raw_size, BASE64_LINE_BYTES)
+    return full_lines * 77 + ((tail_bytes + 2) // 3 * 4 + 1 if tail_bytes else 0)
+
+class AttachmentBlobStore:
+    # Memo of encoded attachment bodies keyed by the SHA-256 of the raw bytes, so the same PDF or
+    # logo carried by every message of a forwarded chain (or by many files of a batch) is
+    # base64-encoded once. Bounded by the total size of the encoded blobs it keeps (LRU eviction);
+    # blobs smaller than min_blob_bytes are cheaper to re-encode than to hash and are not memoized.
+    # If part_keys ({id(part): key}) is given, only those parts are memoized, under the keys
+    # already worked out for them (see message_blob_store).
+    def __init__(self, max_bytes=32 * 1024 * 1024, min_blob_bytes=1024, part_keys=None):
+        self.max_bytes = max_bytes
+        self.min_blob_bytes = min_blob_bytes
+        self.part_keys = part_keys
+        self._encoded_blobs = OrderedDict() # digest -> tuple of encoded chunks
+        self._stored_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0 # Encoded bytes served from the memo instead of being encoded again
+        self.evictions = 0
+
+    def worth_memoizing(self, raw_size):
+        return raw_size >= self.min_blob_bytes and base64_encoded_size(raw_size) <= self.max_bytes
+
+    def key_for(self, part):
+        # SHA-256 of the part's raw bytes, or None if the part is not worth memoizing
+        if self.part_keys is not None:
+            return self.part_keys.get(id(part))
+        if not self.worth_memoizing(part.raw_size()):
+            return None
+        return raw_sha256(part)
+
+    def lookup(self, blob_key, encoded_size):
+        # Returns the memoized encoded chunks (counted as a hit) or None (counted as a miss)
+        encoded_chunks = self._encoded_blobs.get(blob_key)
+        if encoded_chunks is None:
+            self.misses += 1
+            return None
+        self._encoded_blobs.move_to_end(blob_key)
+        self.hits += 1
+        self.bytes_saved += encoded_size
+        return encoded_chunks
+
+    def store(self, blob_key, encoded_chunks, encoded_size):
+        self._encoded_blobs[blob_key] = tuple(encoded_chunks)
+        self._stored_bytes += encoded_size
+        while self._stored_bytes > self.max_bytes:
+            _, evicted_chunks = self._encoded_blobs.popitem(last=False)
+            self._stored_bytes -= sum(len(c) for c in evicted_chunks)
+            self.evictions += 1
+
+    def iter_encoded_chunks(self, part):
+        blob_key = self.key_for(part)
+        if blob_key is None:
+            yield from part.iter_encoded_chunks()
+            return
+        encoded_size = base64_encoded_size(part.raw_size())
+        encoded_chunks = self.lookup(blob_key, encoded_size)
+        if encoded_chunks is not None:
+            yield from encoded_chunks
+            return
+        encoded_chunks = []
+        for encoded_chunk in part.iter_encoded_chunks():
+            encoded_chunks.append(encoded_chunk)
+            yield encoded_chunk
+        self.store(blob_key, encoded_chunks, encoded_size)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytes_saved': self.bytes_saved,
+            'stored_blobs': len(self._encoded_blobs),
+            'stored_bytes': self._stored_bytes,
+            'evictions': self.evictions,
+        }
+
+def iter_lazy_parts(eml_message_obj):
+    # The LazyBase64Parts of a message (nested messages included) that still have to be encoded,
+    # in document order; walk() does not encode them (see LazyBase64Part.is_multipart)
+    return (part for part in eml_message_obj.walk() if isinstance(part, LazyBase64Part) and part._source_data is not None)
+
+DEDUP_PREFIX_BYTES = 4096
+
+def message_blob_store(eml_message_obj):
+    # The blob store for deduplicating attachments within one message, or None if it has no
+    # duplicates. Identical blobs have the same size and the same first bytes, so only parts that
+    # share both with another part are hashed, and only blobs that occur more than once are memoized:
+    # a message without repeated attachments pays for neither.
+    blob_store = AttachmentBlobStore(part_keys={})
+    lookalike_parts = defaultdict(list)
+    for part in iter_lazy_parts(eml_message_obj):
+        raw_size = part.raw_size()
+        if blob_store.worth_memoizing(raw_size):
+            raw_prefix = bytes(next(part.iter_raw_chunks(DEDUP_PREFIX_BYTES), b''))
+            lookalike_parts[(raw_size, raw_prefix)].append(part)
+    part_keys = {}
+    for parts in lookalike_parts.values():
+        if len(parts) > 1:
+            for part in parts:
+                part_keys[id(part)] = raw_sha256(part)
+    key_counts = Counter(part_keys.values())
+    blob_store.part_keys = {part_id: blob_key for part_id, blob_key in part_keys.items() if key_counts[blob_key] > 1}
+    return blob_store if blob_store.part_keys else None
+
 # --- Core EML Building Logic ---
-def build_eml_from_msg_recursively(msg_instance: extract_msg.Message, 
-                                   nesting_level=0, 
-                                   log_callback=print) -> EmailMessage:
-    subject_for_log = getattr(msg_instance, 'subject', 'N/A')
-    log_callback(f"{'  ' * nesting_level}Processing MSG (Subject: '{subject_for_log}')") # Kept as it shows progress
-    
-    eml_obj = EmailMessage() 
+def _emit_metric(metrics_callback, stage, stage_started, **fields):
+    fields['stage'] = stage
+    fields['seconds'] = time.perf_counter() - stage_started
+    metrics_callback(fields)
 
-    # === 1. Set Headers ===
+def extract_header_fields(msg_instance, nesting_level=0, log_callback=print):
+    # Maps the MSG's sender/recipient/date/ID properties to EML header values, without touching the
+    # body or attachments. Returns an OrderedDict in header order; the Subject is not yet RFC 2047
+    # encoded. Shared by set_eml_headers and the metadata-only index (msg_index.py).
+    header_fields = OrderedDict()
     if getattr(msg_instance, 'subject', None):
-        eml_obj['Subject'] = Header(msg_instance.subject, 'utf-8').encode()
+        header_fields['Subject'] = msg_instance.subject
     
     # FROM / SENDER:
     actual_sender_name = None
@@ -84,10 +315,10 @@ def build_eml_from_msg_recursively(msg_instance: extract_msg.Message,
 
     if actual_sender_email and '@' in actual_sender_email:
         display_name_for_from = actual_sender_name if actual_sender_name else ''
-        eml_obj['From'] = email_utils.formataddr((display_name_for_from, actual_sender_email))
+        header_fields['From'] = email_utils.formataddr((display_name_for_from, actual_sender_email))
     elif actual_sender_name: 
-        eml_obj['From'] = email_utils.formataddr((actual_sender_name, '')) 
-        log_callback(f"{'  ' * nesting_level}  Note: Setting 'From' header with only display name: '{eml_obj['From']}' (no email found).") # Kept as info
+        header_fields['From'] = email_utils.formataddr((actual_sender_name, '')) 
+        if log_callback: log_callback(f"{'  ' * nesting_level}  Note: Setting 'From' header with only display name: '{header_fields['From']}' (no email found).") # Kept as info
     # else: No From header will be set if no info found
 
     # TO, CC:
@@ -114,9 +345,9 @@ def build_eml_from_msg_recursively(msg_instance: extract_msg.Message,
                     cc_addresses.append(formatted_address)
     
     if to_addresses:
-        eml_obj['To'] = ", ".join(to_addresses) 
+        header_fields['To'] = ", ".join(to_addresses) 
     if cc_addresses:
-        eml_obj['Cc'] = ", ".join(cc_addresses)
+        header_fields['Cc'] = ", ".join(cc_addresses)
 
     # DATE:
     msg_parsed_date_val = getattr(msg_instance, 'parsedDate', None)
@@ -124,10 +355,10 @@ def build_eml_from_msg_recursively(msg_instance: extract_msg.Message,
     if msg_parsed_date_val:
         if hasattr(msg_parsed_date_val, 'timetuple') and callable(getattr(msg_parsed_date_val, 'timetuple')):
             try:
-                eml_obj['Date'] = email_utils.format_datetime(msg_parsed_date_val)
+                header_fields['Date'] = email_utils.format_datetime(msg_parsed_date_val)
                 date_set_successfully = True
             except Exception as e_fmt_dt: # Kept this warning as it indicates a potential data issue
-                 log_callback(f"{'  ' * nesting_level}  WARNING: Error formatting datetime object {msg_parsed_date_val} with format_datetime: {e_fmt_dt}")
+                 if log_callback: log_callback(f"{'  ' * nesting_level}  WARNING: Error formatting datetime object {msg_parsed_date_val} with format_datetime: {e_fmt_dt}")
         elif isinstance(msg_parsed_date_val, tuple) and len(msg_parsed_date_val) >= 6:
             try:
                 time_tuple_for_mktime = list(msg_parsed_date_val[:9])
@@ -138,22 +369,29 @@ def build_eml_from_msg_recursively(msg_instance: extract_msg.Message,
                 
                 if len(time_tuple_for_mktime) == 9:
                     timestamp = time.mktime(tuple(time_tuple_for_mktime))
-                    eml_obj['Date'] = email_utils.formatdate(timestamp, localtime=True)
+                    header_fields['Date'] = email_utils.formatdate(timestamp, localtime=True)
                     date_set_successfully = True
                 # else: # Removed less critical warning for tuple length
                     # log_callback(f"{'  ' * nesting_level}  WARNING: parsedDate tuple {msg_parsed_date_val} could not be reliably formed into a 9-element tuple for mktime.")
             except (TypeError, ValueError, OverflowError) as e_tuple_conv: # Kept this warning
-                log_callback(f"{'  ' * nesting_level}  WARNING: Could not convert parsedDate tuple {msg_parsed_date_val} to valid Date header: {e_tuple_conv}")
+                if log_callback: log_callback(f"{'  ' * nesting_level}  WARNING: Could not convert parsedDate tuple {msg_parsed_date_val} to valid Date header: {e_tuple_conv}")
     
     if not date_set_successfully and getattr(msg_instance, 'date', None): 
-        eml_obj['Date'] = msg_instance.date
+        header_fields['Date'] = msg_instance.date
 
     # MESSAGE-ID:
     message_id_val = getattr(msg_instance, 'messageId', None)
     if message_id_val:
-        eml_obj['Message-ID'] = message_id_val
-    
-    # === 2. Prepare Body Part(s) ===
+        header_fields['Message-ID'] = message_id_val
+    return header_fields
+
+def set_eml_headers(eml_obj, msg_instance, nesting_level=0, log_callback=print):
+    for header_name, header_value in extract_header_fields(msg_instance, nesting_level, log_callback).items():
+        if header_name == 'Subject':
+            header_value = Header(header_value, 'utf-8').encode()
+        eml_obj[header_name] = header_value
+
+def build_body_part(msg_instance):
     body_structure_parts = [] 
     plain_body = getattr(msg_instance, 'body', None)
     html_body = getattr(msg_instance, 'htmlBody', None)
@@ -169,52 +407,46 @@ def build_eml_from_msg_recursively(msg_instance: extract_msg.Message,
         body_structure_parts.append(MIMEText(plain_body, 'plain', _charset='utf-8'))
     else:
         body_structure_parts.append(MIMEText('', 'plain', _charset='utf-8'))
+    return body_structure_parts[0]
 
-    # === 3. Prepare "File" Attachment Parts ===
-    file_attachment_mime_parts = []
-    for att_index, att in enumerate(getattr(msg_instance, 'attachments', [])):
-        att_long_filename = getattr(att, 'longFilename', None)
-        att_short_filename = getattr(att, 'shortFilename', None)
-        default_att_name = f"attachment_{att_index + 1}"
-        att_name_for_disposition = sanitize_filename(att_long_filename or att_short_filename or default_att_name, default_att_name)
-
-        if isinstance(att.data, extract_msg.Message):
-            log_callback(f"{'  ' * (nesting_level + 1)}-> Processing Nested MSG: '{att_name_for_disposition}'...") # Kept for progress
-            nested_eml_obj = build_eml_from_msg_recursively(att.data, nesting_level + 1, log_callback)
-            if nested_eml_obj:
-                mime_message_part = MIMEMessage(nested_eml_obj)
-                nested_subject = getattr(att.data, 'subject', None)
-                eml_att_filename = sanitize_filename(f"{nested_subject or 'NestedMessage'}.eml", "NestedMessage.eml")
-                mime_message_part.add_header('Content-Disposition', f'attachment; filename="{eml_att_filename}"')
-                file_attachment_mime_parts.append(mime_message_part)
-                # log_callback(f"{'  ' * (nesting_level + 1)}  Done building nested EML part: {eml_att_filename}") # Removed
-        else: 
-            if hasattr(att, 'data') and att.data:
-                # log_callback(f"{'  ' * (nesting_level + 1)}-> Regular Attachment: '{att_name_for_disposition}'") # Can be verbose, removed
-                maintype, subtype = guess_mimetype(att_long_filename or att_short_filename or "")
-                
-                if maintype == 'text':
-                    try:
-                        att_payload_str = att.data.decode('utf-8')
-                        reg_att_part = MIMEText(att_payload_str, subtype, _charset='utf-8')
-                    except UnicodeDecodeError:
-                        reg_att_part = MIMEBase(maintype, subtype, name=att_name_for_disposition)
-                        reg_att_part.set_payload(att.data)
-                        encoders.encode_base64(reg_att_part)
-                else:
-                    reg_att_part = MIMEBase(maintype, subtype, name=att_name_for_disposition)
-                    reg_att_part.set_payload(att.data)
-                    encoders.encode_base64(reg_att_part)
-                
-                reg_att_part.add_header('Content-Disposition', f'attachment; filename="{att_name_for_disposition}"')
-                file_attachment_mime_parts.append(reg_att_part)
+def build_file_attachment_part(att, att_name_for_disposition):
+    # Returns the MIME part for a regular (non-MSG) attachment, or None if it has no data
+    if not (hasattr(att, 'data') and att.data):
+        return None
+    att_long_filename = getattr(att, 'longFilename', None)
+    att_short_filename = getattr(att, 'shortFilename', None)
+    maintype, subtype = guess_mimetype(att_long_filename or att_short_filename or "")
 
-    # === 4. Assemble final EML object structure ===
+    if maintype == 'text':
+        try:
+            att_payload_str = att.data.decode('utf-8')
+            reg_att_part = MIMEText(att_payload_str, subtype, _charset='utf-8')
+        except UnicodeDecodeError:
+            reg_att_part = LazyBase64Part(maintype, subtype, att.data, name=att_name_for_disposition)
+    else:
+        # Encoded only when serialized, in fixed-size chunks (see LazyBase64Part)
+        reg_att_part = LazyBase64Part(maintype, subtype, att.data, name=att_name_for_disposition)
+
+    reg_att_part.add_header('Content-Disposition', f'attachment; filename="{att_name_for_disposition}"')
+    return reg_att_part
+
+def build_nested_message_part(nested_eml_obj, nested_msg_instance):
+    mime_message_part = MIMEMessage(nested_eml_obj)
+    nested_subject = getattr(nested_msg_instance, 'subject', None)
+    eml_att_filename = sanitize_filename(f"{nested_subject or 'NestedMessage'}.eml", "NestedMessage.eml")
+    mime_message_part.add_header('Content-Disposition', f'attachment; filename="{eml_att_filename}"')
+    return mime_message_part
+
+def attachment_name_for_disposition(att, att_index):
+    att_long_filename = getattr(att, 'longFilename', None)
+    att_short_filename = getattr(att, 'shortFilename', None)
+    default_att_name = f"attachment_{att_index + 1}"
+    return sanitize_filename(att_long_filename or att_short_filename or default_att_name, default_att_name)
+
+def assemble_eml(eml_obj, the_body_structure_part, file_attachment_mime_parts, nesting_level=0, log_callback=print):
     if not eml_obj['MIME-Version']: 
         eml_obj['MIME-Version'] = '1.0'
         
-    the_body_structure_part = body_structure_parts[0] 
-
     if not file_attachment_mime_parts:
         eml_obj.set_payload(the_body_structure_part.get_payload())                                                                
         for k_hdr in list(eml_obj.keys()): 
@@ -242,32 +474,496 @@ def build_eml_from_msg_recursively(msg_instance: extract_msg.Message,
                 if isinstance(p_item, EmailMessage): 
                     eml_obj.attach(p_item)
                 else: # Kept this warning as it indicates a structural problem
-                    log_callback(f"{'  ' * nesting_level}  WARNING: Non-Message item encountered in payload list during multipart/mixed reconstruction: {type(p_item)}")
+                    if log_callback: log_callback(f"{'  ' * nesting_level}  WARNING: Non-Message item encountered in payload list during multipart/mixed reconstruction: {type(p_item)}")
     return eml_obj
 
-# --- Main Conversion Function to be called by Streamlit app ---
-def convert_msg_to_single_eml(msg_file_path_or_bytes, output_eml_filename_stem, log_callback=print):
-    log_callback(f"Starting conversion of main MSG: '{output_eml_filename_stem}'")
+class ConversionLimitExceeded(ValueError):
+    # A per-conversion limit was hit; reason names the limit (see conversion_guard)
+    reason = 'limit'
+
+class NestingDepthExceeded(ConversionLimitExceeded):
+    reason = 'nesting_depth'
+
+class AttachmentCountExceeded(ConversionLimitExceeded):
+    reason = 'attachment_count'
+
+class AttachmentSizeExceeded(ConversionLimitExceeded):
+    reason = 'attachment_size'
+
+# MAPI attachment properties (streams inside each __attach_version1.0_#XXXXXXXX storage)
+ATTACH_DATA_BINARY = '__substg1.0_37010102'
+ATTACH_DATA_OBJECT = '__substg1.0_3701000D' # Storage holding an embedded MSG
+ATTACH_LONG_FILENAME = '__substg1.0_3707'
+ATTACH_FILENAME = '__substg1.0_3704'
+ATTACH_DISPLAY_NAME = '__substg1.0_3001'
+NESTED_SUBJECT = '__substg1.0_0037'
+
+def ole_attachments(msg_instance, storage_paths=None, message_path=()):
+    # The attachments of one message, read from the OLE directory without loading their data. The
+    # message is the top-level one, or the embedded MSG stored at message_path (a tuple of storage
+    # names). Returns one dict per attachment, in storage order: 'path' (its storage), 'name',
+    # 'size' of its binary data (None for nested messages and other attachment types) and
+    # 'is_message'. storage_paths is msg_instance.listDir(False, True, False), reusable across calls.
+    if storage_paths is None:
+        storage_paths = msg_instance.listDir(False, True, False)
+    depth = len(message_path)
+    attachment_paths = sorted({tuple(path[:depth + 1]) for path in storage_paths
+                               if len(path) > depth and tuple(path[:depth]) == message_path and path[depth].startswith('__attach')})
+    attachments = []
+    for attachment_path in attachment_paths:
+        attachment_dir = '/'.join(attachment_path)
+        if msg_instance.exists(f"{attachment_dir}/{ATTACH_DATA_OBJECT}"):
+            nested_subject = msg_instance.getStringStream(f"{attachment_dir}/{ATTACH_DATA_OBJECT}/{NESTED_SUBJECT}")
+            name = sanitize_filename(f"{nested_subject or 'NestedMessage'}.eml", "NestedMessage.eml")
+            attachments.append({'path': attachment_path, 'name': name, 'size': None, 'is_message': True})
+            continue
+        name = (msg_instance.getStringStream(f"{attachment_dir}/{ATTACH_LONG_FILENAME}")
+                or msg_instance.getStringStream(f"{attachment_dir}/{ATTACH_FILENAME}")
+                or msg_instance.getStringStream(f"{attachment_dir}/{ATTACH_DISPLAY_NAME}"))
+        size = None
+        if msg_instance.exists(f"{attachment_dir}/{ATTACH_DATA_BINARY}"):
+            size = msg_instance._getOleEntry(f"{attachment_dir}/{ATTACH_DATA_BINARY}").size
+        attachments.append({'path': attachment_path, 'name': name, 'size': size, 'is_message': False})
+    return attachments
+
+def check_attachment_limits(msg_instance, max_attachments=None, max_attachment_bytes=None, max_nesting_depth=None):
+    # Applies build_eml_from_msg's limits to the OLE directory alone (see ole_attachments), so a
+    # message over a limit is turned away before any attachment data is read (open the MSG with
+    # delayAttachments=True). Attachments are counted over the whole tree, nested messages included.
+    if max_attachments is None and max_attachment_bytes is None and max_nesting_depth is None:
+        return
+    storage_paths = msg_instance.listDir(False, True, False)
+    attachment_count = 0
+    pending = [((), 0)] # (message_path, nesting level) of the messages still to look at
+    while pending:
+        message_path, nesting_level = pending.pop()
+        for attachment in ole_attachments(msg_instance, storage_paths, message_path):
+            attachment_count += 1
+            if max_attachments is not None and attachment_count > max_attachments:
+                raise AttachmentCountExceeded(f"Message has more than the maximum of {max_attachments} attachments (nested messages included).")
+            if attachment['is_message']:
+                if max_nesting_depth is not None and nesting_level + 1 > max_nesting_depth:
+                    raise NestingDepthExceeded(f"Nested MSG '{attachment['name']}' exceeds the maximum nesting depth of {max_nesting_depth}.")
+                pending.append((attachment['path'] + (ATTACH_DATA_OBJECT,), nesting_level + 1))
+            elif max_attachment_bytes is not None and attachment['size'] is not None and attachment['size'] > max_attachment_bytes:
+                att_name = sanitize_filename(attachment['name'] or attachment['path'][-1])
+                raise AttachmentSizeExceeded(f"Attachment '{att_name}' is {attachment['size']} bytes, more than the maximum of {max_attachment_bytes}.")
+
+def limit_reason(error):
+    # The limit behind an exception raised during conversion, or None for ordinary errors
+    if isinstance(error, ConversionLimitExceeded):
+        return error.reason
+    if isinstance(error, MemoryError):
+        return 'memory'
+    return None
+
+class _MessageFrame:
+    # One message on the builder's work stack: its EML object with headers and body already set,
+    # and the attachment parts collected so far
+    def __init__(self, msg_instance, nesting_level, name_in_parent=None):
+        self.msg_instance = msg_instance
+        self.nesting_level = nesting_level
+        self.name_in_parent = name_in_parent
+        self.eml_obj = EmailMessage()
+        self.body_part = None
+        self.attachments = [] # Loaded by _start_message_frame
+        self.next_att_index = 0
+        self.file_attachment_mime_parts = []
+        self.started = None
+
+def _start_message_frame(msg_instance, nesting_level, name_in_parent, log_callback, metrics_callback):
+    frame = _MessageFrame(msg_instance, nesting_level, name_in_parent)
+    if metrics_callback is not None:
+        frame.started = time.perf_counter()
+    if log_callback:
+        subject_for_log = getattr(msg_instance, 'subject', 'N/A')
+        log_callback(f"{'  ' * nesting_level}Processing MSG (Subject: '{subject_for_log}')") # Kept as it shows progress
+
+    # === 0. Load Attachments === (the MSG is opened with delayAttachments=True, so this reads their data)
+    if metrics_callback is not None:
+        stage_started = time.perf_counter()
+    frame.attachments = list(getattr(msg_instance, 'attachments', []))
+    if metrics_callback is not None:
+        _emit_metric(metrics_callback, 'attachment_load', stage_started, nesting_level=nesting_level,
+                     attachments=len(frame.attachments),
+                     bytes=sum(len(att.data) for att in frame.attachments if isinstance(getattr(att, 'data', None), bytes)))
+
+    # === 1. Set Headers ===
+    if metrics_callback is not None:
+        stage_started = time.perf_counter()
+    set_eml_headers(frame.eml_obj, msg_instance, nesting_level, log_callback)
+    if metrics_callback is not None:
+        _emit_metric(metrics_callback, 'headers', stage_started, nesting_level=nesting_level,
+                     recipients=len(getattr(msg_instance, 'recipients', None) or []))
+
+    # === 2. Prepare Body Part(s) ===
+    if metrics_callback is not None:
+        stage_started = time.perf_counter()
+    frame.body_part = build_body_part(msg_instance)
+    if metrics_callback is not None:
+        _emit_metric(metrics_callback, 'body', stage_started, nesting_level=nesting_level,
+                     plain_chars=len(getattr(msg_instance, 'body', None) or ''),
+                     html_bytes=len(getattr(msg_instance, 'htmlBody', None) or b''))
+    return frame
+
+def build_eml_from_msg(msg_instance: 'extract_msg.Message',
+                       nesting_level=0,
+                       log_callback=print,
+                       metrics_callback=None,
+                       max_nesting_depth=None,
+                       close_nested=True,
+                       max_attachments=None,
+                       max_attachment_bytes=None) -> EmailMessage:
+    # Builds the EML object for msg_instance and all nested MSG attachments. Nesting is handled with
+    # an explicit work stack instead of recursion, so only the chain of messages currently being
+    # built is live at any time, and each nested extract_msg object is closed as soon as its
+    # message/rfc822 part is done (close_nested). The top-level msg_instance belongs to the caller
+    # and is left open.
+    # max_nesting_depth limits how many levels of nested MSGs are followed; going deeper raises
+    # NestingDepthExceeded. max_attachments (counted over the whole tree, nested MSGs included) and
+    # max_attachment_bytes (per attachment) raise AttachmentCountExceeded / AttachmentSizeExceeded.
+    # log_callback=None skips building log messages altogether.
+    # metrics_callback, if given, is called with one dict per stage ({'stage': ..., 'seconds': ...,
+    # plus stage-specific counts}); see conversion_metrics.ConversionMetrics for a collector.
+    work_stack = [_start_message_frame(msg_instance, nesting_level, None, log_callback, metrics_callback)]
+    attachment_count = len(work_stack[0].attachments)
+    if max_attachments is not None and attachment_count > max_attachments:
+        raise AttachmentCountExceeded(f"Message has {attachment_count} attachments, more than the maximum of {max_attachments}.")
+    while True:
+        frame = work_stack[-1]
+
+        # === 3. Prepare "File" Attachment Parts (descending into the next nested MSG, if any) ===
+        nested_frame = None
+        while frame.next_att_index < len(frame.attachments):
+            att_index = frame.next_att_index
+            att = frame.attachments[att_index]
+            frame.next_att_index += 1
+            att_name_for_disposition = attachment_name_for_disposition(att, att_index)
+
+            if isinstance(att.data, load_extract_msg().Message):
+                if max_nesting_depth is not None and frame.nesting_level - nesting_level + 1 > max_nesting_depth:
+                    raise NestingDepthExceeded(f"Nested MSG '{att_name_for_disposition}' exceeds the maximum nesting depth of {max_nesting_depth}.")
+                if log_callback:
+                    log_callback(f"{'  ' * (frame.nesting_level + 1)}-> Processing Nested MSG: '{att_name_for_disposition}'...") # Kept for progress
+                nested_frame = _start_message_frame(att.data, frame.nesting_level + 1, att_name_for_disposition,
+                                                    log_callback, metrics_callback)
+                attachment_count += len(nested_frame.attachments)
+                if max_attachments is not None and attachment_count > max_attachments:
+                    raise AttachmentCountExceeded(f"Message has more than the maximum of {max_attachments} attachments (nested messages included).")
+                break
+
+            if max_attachment_bytes is not None and hasattr(att, 'data') and att.data and len(att.data) > max_attachment_bytes:
+                raise AttachmentSizeExceeded(f"Attachment '{att_name_for_disposition}' is {len(att.data)} bytes, more than the maximum of {max_attachment_bytes}.")
+
+            if metrics_callback is not None:
+                stage_started = time.perf_counter()
+            reg_att_part = build_file_attachment_part(att, att_name_for_disposition)
+            if reg_att_part is not None:
+                frame.file_attachment_mime_parts.append(reg_att_part)
+                if metrics_callback is not None:
+                    _emit_metric(metrics_callback, 'attachment', stage_started, nesting_level=frame.nesting_level,
+                                 name=att_name_for_disposition, bytes=len(att.data))
+        if nested_frame is not None:
+            work_stack.append(nested_frame)
+            continue
+
+        # === 4. Assemble final EML object structure ===
+        work_stack.pop()
+        eml_obj = assemble_eml(frame.eml_obj, frame.body_part, frame.file_attachment_mime_parts, frame.nesting_level, log_callback)
+        if not work_stack:
+            return eml_obj
+
+        parent_frame = work_stack[-1]
+        if eml_obj:
+            parent_frame.file_attachment_mime_parts.append(build_nested_message_part(eml_obj, frame.msg_instance))
+        if metrics_callback is not None: # Includes the nested message's own stages
+            _emit_metric(metrics_callback, 'nested_message', frame.started, nesting_level=frame.nesting_level,
+                         name=frame.name_in_parent)
+        if close_nested:
+            frame.msg_instance.close()
+
+def build_eml_from_msg_recursively(msg_instance: 'extract_msg.Message', 
+                                   nesting_level=0, 
+                                   log_callback=print,
+                                   metrics_callback=None) -> EmailMessage:
+    # Kept for existing callers; the work is done by the (non-recursive) build_eml_from_msg
+    return build_eml_from_msg(msg_instance, nesting_level, log_callback, metrics_callback)
+
+# --- Streaming EML Serialization ---
+class StreamingBytesGenerator(BytesGenerator):
+    # The stdlib generator renders every part into a buffer before writing it out, so that it
+    # can pick a multipart boundary that does not occur in the rendered text. That means the whole
+    # message is held in memory (several times over for nested parts) before the first byte is written.
+    # Here container parts (multipart/*, message/rfc822) get their headers written first and their
+    # children streamed straight to the output; only leaf parts are still rendered one at a time.
+    # Boundaries are chosen up front with the same random generator the stdlib uses, without the
+    # collision scan (which needs the full text); our leaf parts are base64-encoded, so a collision
+    # would need the random token itself to appear in the output. LazyBase64Part bodies are
+    # encoded and written chunk by chunk, through blob_store when one is given.
+    def __init__(self, outfp, mangle_from_=None, maxheaderlen=None, *, policy=None, blob_store=None, metrics_callback=None):
+        super().__init__(outfp, mangle_from_, maxheaderlen, policy=policy)
+        self._blob_store = blob_store
+        self._metrics_callback = metrics_callback
+
+    def clone(self, fp):
+        generator_clone = super().clone(fp)
+        generator_clone._blob_store = self._blob_store
+        generator_clone._metrics_callback = self._metrics_callback
+        return generator_clone
+
+    def _write(self, msg):
+        if isinstance(msg, LazyBase64Part) and msg._source_data is not None:
+            self._write_lazy_base64_part(msg)
+            return
+        if not msg.is_multipart():
+            super()._write(msg)
+            return
+        if msg.get_content_maintype() == 'multipart' and not msg.get_boundary():
+            msg.set_boundary(self._make_boundary())
+        meth = getattr(msg, '_write_headers', None)
+        if meth is None:
+            self._write_headers(msg)
+        else:
+            meth(self)
+        self._dispatch(msg)
+
+    def _write_lazy_base64_part(self, msg):
+        self._write_headers(msg)
+        if self._blob_store is not None:
+            encoded_chunks = self._blob_store.iter_encoded_chunks(msg)
+        else:
+            encoded_chunks = msg.iter_encoded_chunks()
+        if self._metrics_callback is None:
+            for encoded_chunk in encoded_chunks:
+                self._write_encoded_chunk(encoded_chunk)
+            return
+
+        # Same loop, timing only the encoding (not the writes)
+        dedup_hits_before = self._blob_store.hits if self._blob_store is not None else 0
+        encode_seconds = 0.0
+        encoded_bytes = 0
+        encoded_chunks = iter(encoded_chunks)
+        while True:
+            chunk_started = time.perf_counter()
+            encoded_chunk = next(encoded_chunks, None)
+            encode_seconds += time.perf_counter() - chunk_started
+            if encoded_chunk is None:
+                break
+            encoded_bytes += len(encoded_chunk)
+            self._write_encoded_chunk(encoded_chunk)
+        self._metrics_callback({
+            'stage': 'attachment_encode',
+            'seconds': encode_seconds,
+            'name': msg.get_filename(),
+            'bytes': msg.raw_size(),
+            'encoded_bytes': encoded_bytes,
+            'deduplicated': self._blob_store is not None and self._blob_store.hits > dedup_hits_before,
+        })
+
+    def _write_encoded_chunk(self, encoded_chunk):
+        if self._encoded_NL != b'\n':
+            encoded_chunk = encoded_chunk.replace(b'\n', self._encoded_NL)
+        self._fp.write(encoded_chunk)
+
+    def _flatten_subpart(self, part):
+        self.clone(self._fp).flatten(part, unixfrom=False, linesep=self._NL)
+
+    def _handle_multipart(self, msg):
+        subparts = msg.get_payload()
+        if subparts is None:
+            subparts = []
+        elif isinstance(subparts, str):
+            self.write(subparts)
+            return
+        elif not isinstance(subparts, list):
+            subparts = [subparts]
+        boundary = msg.get_boundary()
+        if msg.preamble is not None:
+            self._write_lines(msg.preamble)
+            self.write(self._NL)
+        self.write('--' + boundary + self._NL)
+        for part_index, part in enumerate(subparts):
+            if part_index:
+                self.write(self._NL + '--' + boundary + self._NL)
+            self._flatten_subpart(part)
+        self.write(self._NL + '--' + boundary + '--' + self._NL)
+        if msg.epilogue is not None:
+            self._write_lines(msg.epilogue)
+
+    def _handle_message(self, msg):
+        payload = msg._payload
+        if isinstance(payload, list):
+            self._flatten_subpart(msg.get_payload(0))
+        else:
+            self._fp.write(self._encode(payload))
+
+class _CountingWriter:
+    def __init__(self, fp):
+        self._fp = fp
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self._fp.write(data)
+
+class _CacheTeeWriter:
+    # Passes writes through and hands a copy to a conversion cache entry writer, which keeps at
+    # most the cache's memory tier in RAM (see conversion_cache.CacheEntryWriter)
+    def __init__(self, fp, entry_writer):
+        self._fp = fp
+        self._entry_writer = entry_writer
+
+    def write(self, data):
+        self._entry_writer.write(data)
+        return self._fp.write(data)
+
+def write_eml_message(eml_message_obj, output_fp, blob_store=None, metrics_callback=None):
+    # Same output as eml_message_obj.as_bytes(), written incrementally to a binary file object
+    counting_fp = _CountingWriter(output_fp)
+    generator = StreamingBytesGenerator(counting_fp, mangle_from_=False, policy=eml_message_obj.policy,
+                                        blob_store=blob_store, metrics_callback=metrics_callback)
+    generator.flatten(eml_message_obj, unixfrom=False)
+    return counting_fp.bytes_written
+
+def read_msg_bytes(msg_file_path_or_bytes):
+    if isinstance(msg_file_path_or_bytes, (bytes, bytearray)):
+        return bytes(msg_file_path_or_bytes)
+    if isinstance(msg_file_path_or_bytes, (str, os.PathLike)):
+        with open(msg_file_path_or_bytes, 'rb') as f:
+            return f.read()
+    if hasattr(msg_file_path_or_bytes, 'getvalue'): # BytesIO / Streamlit UploadedFile
+        return msg_file_path_or_bytes.getvalue()
+    msg_file_path_or_bytes.seek(0)
+    return msg_file_path_or_bytes.read()
+
+def _write_output(output_file_or_path, write_func):
+    # Runs write_func(fp) against a file object, or a file opened at the given path.
+    # A half-written file is removed if write_func fails.
+    if not isinstance(output_file_or_path, (str, os.PathLike)):
+        return write_func(output_file_or_path)
     try:
-        main_msg_instance = extract_msg.Message(msg_file_path_or_bytes)
-    except Exception as e:
-        log_callback(f"Error reading main MSG file: {e}") # Important error
+        with open(output_file_or_path, 'wb') as output_fp:
+            return write_func(output_fp)
+    except Exception:
+        if os.path.exists(output_file_or_path):
+            os.remove(output_file_or_path) # Don't leave a truncated .eml behind
+        raise
+
+# --- Main Conversion Functions to be called by Streamlit app ---
+def convert_msg_to_eml_stream(msg_file_path_or_bytes, output_file_or_path, output_eml_filename_stem, log_callback=print, cache=None,
+                              blob_store=None, metrics_callback=None, max_nesting_depth=None, max_attachments=None,
+                              max_attachment_bytes=None):
+    # output_file_or_path is either a binary file object opened for writing or a filesystem path.
+    # cache is an optional conversion_cache.ConversionCache; repeat conversions of the same MSG bytes
+    # are then served from it without parsing the MSG again.
+    # blob_store is an AttachmentBlobStore to share across conversions (e.g. a whole batch);
+    # by default identical attachments are only deduplicated within this one message (see message_blob_store).
+    # metrics_callback receives one dict per stage (see build_eml_from_msg) plus 'ole_parse',
+    # 'serialize' and a final 'conversion' event; log_callback=None disables logging.
+    # max_nesting_depth, max_attachments and max_attachment_bytes, if set, fail the conversion for
+    # MSGs beyond those limits (see build_eml_from_msg); the 'conversion' metrics event then carries
+    # the limit hit as 'limit'.
+    # Returns (bytes_written, suggested_filename), or (None, None) on failure.
+    if metrics_callback is not None:
+        conversion_started = time.perf_counter()
+    def fail(message, limit=None):
+        if log_callback: log_callback(message) # Important error
+        if metrics_callback is not None:
+            _emit_metric(metrics_callback, 'conversion', conversion_started, status='failed', error=message, limit=limit)
         return None, None
 
-    final_eml_message_obj = build_eml_from_msg_recursively(main_msg_instance, log_callback=log_callback)
+    if log_callback: log_callback(f"Starting conversion of main MSG: '{output_eml_filename_stem}'")
+    suggested_filename = f"{sanitize_filename(output_eml_filename_stem)}.eml"
 
-    if final_eml_message_obj:
+    cache_key = None
+    if cache is not None:
         try:
-            eml_bytes = final_eml_message_obj.as_bytes()
-            suggested_filename = f"{sanitize_filename(output_eml_filename_stem)}.eml"
-            log_callback(f"Successfully converted MSG to EML bytes. Suggested filename: {suggested_filename}") # Good final message
-            return eml_bytes, suggested_filename
+            msg_file_path_or_bytes = read_msg_bytes(msg_file_path_or_bytes)
         except Exception as e:
-            log_callback(f"Error serializing final EML object to bytes: {e}") # Important error
-            return None, None
-    else:
-        log_callback("Failed to produce a final EML object from the main MSG file.") # Important error
+            return fail(f"Error reading main MSG file: {e}")
+        cache_key = cache.key_for(msg_file_path_or_bytes)
+        cached_eml_bytes = cache.get(cache_key)
+        if cached_eml_bytes is not None:
+            try:
+                _write_output(output_file_or_path, lambda output_fp: output_fp.write(cached_eml_bytes))
+            except Exception as e:
+                return fail(f"Error writing cached EML: {e}")
+            if log_callback: log_callback(f"Served from conversion cache ({len(cached_eml_bytes)} bytes). Suggested filename: {suggested_filename}")
+            if metrics_callback is not None:
+                _emit_metric(metrics_callback, 'conversion', conversion_started, status='cache_hit', output_bytes=len(cached_eml_bytes))
+            return len(cached_eml_bytes), suggested_filename
+
+    if metrics_callback is not None:
+        stage_started = time.perf_counter()
+    try:
+        # Attachment data is only read when build_eml_from_msg gets to each message, after the limits are checked
+        main_msg_instance = load_extract_msg().Message(msg_file_path_or_bytes, delayAttachments=True)
+    except Exception as e:
+        return fail(f"Error reading main MSG file: {str(e) or type(e).__name__}", limit_reason(e))
+    if metrics_callback is not None:
+        input_bytes = len(msg_file_path_or_bytes) if isinstance(msg_file_path_or_bytes, (bytes, bytearray)) else None
+        if isinstance(msg_file_path_or_bytes, (str, os.PathLike)):
+            input_bytes = os.path.getsize(msg_file_path_or_bytes)
+        _emit_metric(metrics_callback, 'ole_parse', stage_started, input_bytes=input_bytes)
+
+    try:
+        check_attachment_limits(main_msg_instance, max_attachments, max_attachment_bytes, max_nesting_depth)
+        final_eml_message_obj = build_eml_from_msg(main_msg_instance, log_callback=log_callback, metrics_callback=metrics_callback,
+                                                   max_nesting_depth=max_nesting_depth, max_attachments=max_attachments,
+                                                   max_attachment_bytes=max_attachment_bytes)
+    except ConversionLimitExceeded as e:
+        return fail(f"Error building EML: {e}", e.reason)
+    except MemoryError:
+        return fail("Error building EML: out of memory.", 'memory')
+    finally:
+        # Everything serialization needs is now in the EML object; release the OLE file handle
+        main_msg_instance.close()
+
+    if not final_eml_message_obj:
+        return fail("Failed to produce a final EML object from the main MSG file.")
+
+    cache_entry = cache.entry_writer(cache_key) if cache_key is not None else None
+    def write_eml(output_fp):
+        if cache_entry is not None:
+            output_fp = _CacheTeeWriter(output_fp, cache_entry)
+        return write_eml_message(final_eml_message_obj, output_fp, blob_store=blob_store, metrics_callback=metrics_callback)
+
+    if blob_store is None:
+        blob_store = message_blob_store(final_eml_message_obj)
+    hits_before, bytes_saved_before = (blob_store.hits, blob_store.bytes_saved) if blob_store is not None else (0, 0)
+    if metrics_callback is not None:
+        stage_started = time.perf_counter()
+    try:
+        bytes_written = _write_output(output_file_or_path, write_eml)
+    except Exception as e:
+        if cache_entry is not None:
+            cache_entry.discard()
+        return fail(f"Error serializing final EML object: {str(e) or type(e).__name__}", limit_reason(e))
+    if metrics_callback is not None: # Includes the lazy attachment encoding reported as 'attachment_encode'
+        _emit_metric(metrics_callback, 'serialize', stage_started, output_bytes=bytes_written,
+                     dedup_bytes_saved=blob_store.bytes_saved - bytes_saved_before if blob_store is not None else 0)
+    if cache_entry is not None:
+        cache_entry.commit()
+    if log_callback:
+        if blob_store is not None and blob_store.hits > hits_before:
+            log_callback(f"Reused {blob_store.hits - hits_before} duplicate attachment(s), "
+                         f"saving {blob_store.bytes_saved - bytes_saved_before} bytes of base64 encoding.")
+        log_callback(f"Successfully converted MSG to EML ({bytes_written} bytes). Suggested filename: {suggested_filename}")
+    if metrics_callback is not None:
+        _emit_metric(metrics_callback, 'conversion', conversion_started, status='converted', output_bytes=bytes_written)
+    return bytes_written, suggested_filename
+
+def convert_msg_to_single_eml(msg_file_path_or_bytes, output_eml_filename_stem, log_callback=print, cache=None, blob_store=None,
+                              metrics_callback=None, max_nesting_depth=None, max_attachments=None, max_attachment_bytes=None):
+    eml_buffer = BytesIO()
+    bytes_written, suggested_filename = convert_msg_to_eml_stream(msg_file_path_or_bytes, eml_buffer, output_eml_filename_stem,
+                                                                  log_callback=log_callback, cache=cache, blob_store=blob_store,
+                                                                  metrics_callback=metrics_callback, max_nesting_depth=max_nesting_depth,
+                                                                  max_attachments=max_attachments,
+                                                                  max_attachment_bytes=max_attachment_bytes)
+    if bytes_written is None:
         return None, None
+    return eml_buffer.getvalue(), suggested_filename
 
 if __name__ == '__main__':
     print("Testing msg_converter_core.py directly...")
@@ -0,0 +1,209 @@
+# msg_index.py
+# Metadata-only scan of an MSG corpus into a searchable SQLite index, for triage before conversion:
+#
+#   python msg_index.py path/to/export --db export_index.sqlite
+#   sqlite3 export_index.sqlite "SELECT date_utc, sender, subject FROM messages WHERE subject LIKE '%invoice%'"
+#
+# Only headers and the OLE directory are read: bodies are never decoded and attachment data is never
+# loaded (attachment sizes come from the OLE stream sizes). Header values go through the same
+# mapping as the converter (msg_converter_core.extract_header_fields), so the index shows exactly
+# what the EML would. Re-running over the same tree only rescans files whose size or mtime changed.
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timezone
+from email import utils as email_utils
+
+import extract_msg
+import msg_converter_core # Import our conversion logic
+from batch_convert import find_msg_files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    subject TEXT,
+    sender TEXT,
+    sender_email TEXT,
+    recipients_to TEXT,
+    recipients_cc TEXT,
+    date TEXT,
+    date_utc TEXT,
+    message_id TEXT,
+    attachment_count INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS attachments (
+    path TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    size INTEGER,
+    is_message INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (path, position)
+);
+CREATE INDEX IF NOT EXISTS messages_date_utc ON messages (date_utc);
+CREATE INDEX IF NOT EXISTS messages_sender_email ON messages (sender_email);
+CREATE INDEX IF NOT EXISTS attachments_name ON attachments (name);
+"""
+
+MESSAGE_COLUMNS = ('path', 'size', 'mtime', 'subject', 'sender', 'sender_email', 'recipients_to', 'recipients_cc',
+                   'date', 'date_utc', 'message_id', 'attachment_count', 'error')
+
+# --- Scanning (runs in worker processes) ---
+def attachment_metadata(msg_instance):
+    # Names and sizes of the attachments, read from the OLE directory without loading their data
+    return [{'position': position, 'name': attachment['name'], 'size': attachment['size'], 'is_message': int(attachment['is_message'])}
+            for position, attachment in enumerate(msg_converter_core.ole_attachments(msg_instance))]
+
+def date_as_utc_text(date_value):
+    # Sortable ISO 8601 UTC timestamp for the Date header value, or None
+    try:
+        parsed = email_utils.parsedate_to_datetime(str(date_value))
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat(sep=' ')
+
+def scan_msg_metadata(msg_path):
+    record = dict.fromkeys(MESSAGE_COLUMNS)
+    record['path'] = msg_path
+    record['attachments'] = []
+    try:
+        file_stat = os.stat(msg_path)
+        record['size'] = file_stat.st_size
+        record['mtime'] = file_stat.st_mtime
+        # delayAttachments: extract-msg would otherwise read every attachment's data on open
+        msg_instance = extract_msg.openMsg(msg_path, delayAttachments=True)
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+        return record
+    try:
+        header_fields = msg_converter_core.extract_header_fields(msg_instance, log_callback=None)
+        sender = header_fields.get('From')
+        record['subject'] = header_fields.get('Subject')
+        record['sender'] = sender
+        record['sender_email'] = (email_utils.parseaddr(sender)[1] or None) if sender else None
+        record['recipients_to'] = header_fields.get('To')
+        record['recipients_cc'] = header_fields.get('Cc')
+        if header_fields.get('Date') is not None:
+            record['date'] = str(header_fields['Date'])
+            record['date_utc'] = date_as_utc_text(header_fields['Date'])
+        record['message_id'] = header_fields.get('Message-ID')
+        record['attachments'] = attachment_metadata(msg_instance)
+        record['attachment_count'] = len(record['attachments'])
+    except Exception as e: # Keep whatever was read; the file is still listed with its error
+        record['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        msg_instance.close()
+    return record
+
+# --- Index ---
+def open_index(db_path):
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL') # Safe with WAL; a crash loses at most the last batch
+    connection.executescript(SCHEMA)
+    return connection
+
+def write_batch(connection, records):
+    # One transaction per batch: replaces the rows of rescanned files, then bulk-inserts the new ones
+    paths = [(record['path'],) for record in records]
+    with connection:
+        connection.executemany('DELETE FROM attachments WHERE path = ?', paths)
+        connection.executemany(
+            f"INSERT OR REPLACE INTO messages ({', '.join(MESSAGE_COLUMNS)}) VALUES ({', '.join('?' * len(MESSAGE_COLUMNS))})",
+            [tuple(record[column] for column in MESSAGE_COLUMNS) for record in records])
+        connection.executemany(
+            'INSERT INTO attachments (path, position, name, size, is_message) VALUES (?, ?, ?, ?, ?)',
+            [(record['path'], attachment['position'], attachment['name'], attachment['size'], attachment['is_message'])
+             for record in records for attachment in record['attachments']])
+
+def index_directory(input_dir, db_path, jobs=None, batch_size=500, log_callback=print):
+    # Returns a summary dict. Files already indexed with the same size and mtime are skipped (unless
+    # they failed last time), and entries for files under input_dir that no longer exist are removed.
+    msg_paths = find_msg_files(input_dir)
+    connection = open_index(db_path)
+    try:
+        input_prefix = os.path.join(input_dir, '')
+        indexed = {}
+        for path, size, mtime, error in connection.execute(
+                'SELECT path, size, mtime, error FROM messages WHERE substr(path, 1, ?) = ?', (len(input_prefix), input_prefix)):
+            indexed[path] = (size, mtime) if error is None else None # Files that failed are always rescanned
+        to_scan = []
+        for msg_path in msg_paths:
+            try:
+                file_stat = os.stat(msg_path)
+            except OSError:
+                continue
+            if indexed.get(msg_path) != (file_stat.st_size, file_stat.st_mtime):
+                to_scan.append(msg_path)
+        removed = [(path,) for path in set(indexed) - set(msg_paths)]
+        if removed:
+            with connection:
+                connection.executemany('DELETE FROM attachments WHERE path = ?', removed)
+                connection.executemany('DELETE FROM messages WHERE path = ?', removed)
+
+        jobs = jobs or os.cpu_count() or 1
+        log_callback(f"Found {len(msg_paths)} .msg file(s) under '{input_dir}': {len(to_scan)} to scan, "
+                     f"{len(msg_paths) - len(to_scan)} unchanged. Scanning with {jobs} worker(s)...")
+        started = time.perf_counter()
+        failed = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunksize = max(1, min(64, len(to_scan) // (jobs * 8)))
+            for scanned_count, record in enumerate(executor.map(scan_msg_metadata, to_scan, chunksize=chunksize), 1):
+                if record['error']:
+                    failed += 1
+                    log_callback(f"  Could not fully read {record['path']}: {record['error']}")
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    write_batch(connection, batch)
+                    batch = []
+                    log_callback(f"  Indexed {scanned_count}/{len(to_scan)}")
+            if batch:
+                write_batch(connection, batch)
+        elapsed = time.perf_counter() - started
+    finally:
+        connection.close()
+    return {
+        'total': len(msg_paths),
+        'scanned': len(to_scan),
+        'unchanged': len(msg_paths) - len(to_scan),
+        'removed': len(removed),
+        'failed': failed,
+        'elapsed_seconds': elapsed,
+        'files_per_second': len(to_scan) / elapsed if elapsed > 0 else 0.0,
+    }
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Index the headers and attachment names/sizes of every .msg file under a directory into SQLite.")
+    parser.add_argument('input_dir', help="Directory to search (recursively) for .msg files.")
+    parser.add_argument('--db', help="SQLite index to create or update. Defaults to '<input_dir>_index.sqlite'.")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes. Defaults to the number of CPU cores.")
+    parser.add_argument('--batch-size', type=int, default=500, help="Files written per transaction (default: 500).")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    input_dir = os.path.abspath(args.input_dir)
+    if not os.path.isdir(input_dir):
+        print(f"Error: input directory not found: {args.input_dir}")
+        return 2
+    db_path = os.path.abspath(args.db or f"{input_dir.rstrip(os.sep)}_index.sqlite")
+    summary = index_directory(input_dir, db_path, jobs=args.jobs, batch_size=max(1, args.batch_size))
+    print(f"Indexed {summary['scanned']} file(s) ({summary['unchanged']} unchanged, {summary['removed']} removed, "
+          f"{summary['failed']} with errors) in {summary['elapsed_seconds']:.2f}s: {summary['files_per_second']:.1f} files/s")
+    print(f"Index written to: {db_path}")
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support() # Needed for the process pool in a PyInstaller build
+    sys.exit(main())
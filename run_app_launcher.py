@@ -3,14 +3,35 @@ import subprocess
 import os
 import sys
 import webbrowser
-import time # To give the server a moment to start
+import time
+import urllib.error
+import urllib.request
 
 def get_path(filename):
     if hasattr(sys, "_MEIPASS"): # PyInstaller temp folder
         return os.path.join(sys._MEIPASS, filename)
     return filename # Running as script
 
+def wait_for_server(url, process, timeout_seconds=60.0, poll_interval=0.1):
+    # Polls Streamlit's health endpoint until it answers. Returns True when the server is ready,
+    # False if the Streamlit process exited or the timeout passed first.
+    health_url = f"{url}/_stcore/health"
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({})) # Never route localhost through a proxy
+    deadline = time.perf_counter() + timeout_seconds
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with opener.open(health_url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass # Not listening yet
+        time.sleep(poll_interval)
+    return False
+
 if __name__ == '__main__':
+    launch_started = time.time()
     app_py_path = get_path('app.py') 
     streamlit_cmd = "streamlit" # Assume streamlit is in PATH or bundled correctly
     
@@ -34,20 +55,27 @@ if __name__ == '__main__':
     print(f"This window shows server logs. Close this window to stop the application.")
     
     try:
-        # Start Streamlit as a background process
-        process = subprocess.Popen(cmd)
-        
-        # Give the server a few seconds to start up before trying to open the browser
-        print("Waiting for Streamlit server to start...")
-        time.sleep(3) # Adjust as needed; 2-5 seconds is usually enough
+        # Start Streamlit as a background process. The launch time is passed on so the app can
+        # report its time to first render.
+        process = subprocess.Popen(cmd, env=dict(os.environ, MSG2EML_LAUNCH_STARTED=str(launch_started)))
+        print(f"[startup] Streamlit process started after {time.time() - launch_started:.2f}s")
 
-        # Check if the server seems to be running (optional, but good practice)
-        # A more robust check would be to try making an HTTP request to the health endpoint
-        # For now, we'll assume it starts within the sleep period.
+        # Open the browser as soon as the server answers its health check, rather than after a
+        # fixed delay (too slow on fast machines, too early while a frozen bundle is unpacking)
+        print("Waiting for Streamlit server to start...")
+        if wait_for_server(url, process):
+            print(f"[startup] Streamlit server ready after {time.time() - launch_started:.2f}s")
+        elif process.poll() is not None:
+            print(f"Error: Streamlit exited during startup (exit code {process.returncode}). See the messages above.")
+            input("Press Enter to exit...")
+            sys.exit(1)
+        else:
+            print("WARNING: Streamlit did not answer its health check in time; opening the browser anyway.")
 
         print(f"Opening browser to {url}...")
         webbrowser.open(url) # Open the URL in the default web browser
-        
+        print(f"[startup] Browser opened after {time.time() - launch_started:.2f}s")
+
         process.wait() # Wait for the Streamlit process to terminate (e.g., user closes the terminal)
 
     except FileNotFoundError:
@@ -0,0 +1,27 @@
+# tests/conftest.py
+# Shared fixtures: a small synthetic corpus from benchmarks/msg_corpus.py, generated once per test run.
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for import_dir in (REPO_ROOT, os.path.join(REPO_ROOT, 'benchmarks')):
+    if import_dir not in sys.path:
+        sys.path.insert(0, import_dir)
+
+import msg_corpus
+
+# Big enough that the large attachments span several base64 chunks, small enough to stay fast
+CORPUS_SCALE = 0.1
+
+@pytest.fixture(scope='session')
+def corpus_dir(tmp_path_factory):
+    corpus_dir = tmp_path_factory.mktemp('msg_corpus')
+    for name in msg_corpus.SCENARIOS:
+        msg_corpus.generate_scenario(name, str(corpus_dir / f"{name}.msg"), scale=CORPUS_SCALE)
+    return corpus_dir
+
+@pytest.fixture(params=sorted(msg_corpus.SCENARIOS))
+def scenario_msg(request, corpus_dir):
+    return str(corpus_dir / f"{request.param}.msg")
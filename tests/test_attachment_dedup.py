@@ -0,0 +1,40 @@
+# tests/test_attachment_dedup.py
+import msg_converter_core
+
+class NullWriter:
+    def write(self, data):
+        return len(data)
+
+def build_eml(msg_path):
+    msg_instance = msg_converter_core.load_extract_msg().Message(msg_path)
+    try:
+        return msg_converter_core.build_eml_from_msg(msg_instance, log_callback=None)
+    finally:
+        msg_instance.close()
+
+def test_no_store_without_duplicates(monkeypatch, corpus_dir):
+    # Same-size attachments with different content are told apart without hashing them
+    eml_obj = build_eml(str(corpus_dir / 'large_binary_attachments.msg'))
+    def fail_on_hash(part):
+        raise AssertionError(f"{part.get_filename()} was hashed")
+    monkeypatch.setattr(msg_converter_core, 'raw_sha256', fail_on_hash)
+    assert msg_converter_core.message_blob_store(eml_obj) is None
+
+def test_store_only_keeps_repeated_blobs(corpus_dir):
+    eml_obj = build_eml(str(corpus_dir / 'forwarded_duplicates.msg'))
+    blob_store = msg_converter_core.message_blob_store(eml_obj)
+    memoized_parts = [part for part in msg_converter_core.iter_lazy_parts(eml_obj) if blob_store.key_for(part) is not None]
+    assert {part.get_filename() for part in memoized_parts} == {'contract.pdf', 'logo.png'}
+    assert len(set(map(blob_store.key_for, memoized_parts))) == 2
+
+def test_duplicates_are_encoded_once(monkeypatch, corpus_dir):
+    encoded_raw_bytes = []
+    encode_base64_lines = msg_converter_core.encode_base64_lines
+    def counting_encode(raw_chunk):
+        encoded_raw_bytes.append(len(raw_chunk))
+        return encode_base64_lines(raw_chunk)
+    monkeypatch.setattr(msg_converter_core, 'encode_base64_lines', counting_encode)
+    eml_obj = build_eml(str(corpus_dir / 'forwarded_duplicates.msg'))
+    unique_raw_bytes = sum({part.get_filename(): part.raw_size() for part in msg_converter_core.iter_lazy_parts(eml_obj)}.values())
+    msg_converter_core.write_eml_message(eml_obj, NullWriter(), blob_store=msg_converter_core.message_blob_store(eml_obj))
+    assert sum(encoded_raw_bytes) == unique_raw_bytes
@@ -0,0 +1,33 @@
+# tests/test_batch_convert.py
+import os
+import shutil
+
+import batch_convert
+
+def convert_or_crash(msg_path, eml_path, **options):
+    # Runs in the pool's worker: stands in for a segfault or the OOM killer on one file
+    if 'crash' in os.path.basename(msg_path):
+        os._exit(1)
+    return batch_convert.convert_one_file(msg_path, eml_path, **options)
+
+def test_sources_with_the_same_sanitized_name_get_distinct_outputs(tmp_path, corpus_dir):
+    input_dir = tmp_path / 'in'
+    (input_dir / 'sub').mkdir(parents=True)
+    for name in ('a b.msg', 'a_b.msg', 'x.msg', 'x.MSG'):
+        shutil.copy(str(corpus_dir / 'html_and_plain.msg'), str(input_dir / 'sub' / name))
+    output_dir = tmp_path / 'out'
+    results, summary = batch_convert.convert_directory(str(input_dir), str(output_dir), jobs=2, log_callback=lambda message: None)
+    assert summary['converted'] == 4
+    assert sorted(os.listdir(str(output_dir / 'sub'))) == ['a_b (2).eml', 'a_b.eml', 'x (2).eml', 'x.eml']
+    assert len({result['output'] for result in results}) == 4
+
+def test_crashed_worker_fails_only_its_file(monkeypatch, tmp_path, corpus_dir):
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    for name in ('a.msg', 'b_crash.msg', 'c.msg'):
+        shutil.copy(str(corpus_dir / 'html_and_plain.msg'), str(input_dir / name))
+    monkeypatch.setattr(batch_convert, 'convert_one_file', convert_or_crash)
+    results, summary = batch_convert.convert_directory(str(input_dir), str(tmp_path / 'out'), jobs=2, log_callback=lambda message: None)
+    assert [result['status'] for result in results] == ['converted', 'failed', 'converted']
+    assert results[1]['limit'] == 'crashed'
+    assert summary['failed'] == 1
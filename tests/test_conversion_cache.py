@@ -0,0 +1,46 @@
+# tests/test_conversion_cache.py
+from io import BytesIO
+
+import msg_converter_core
+from conversion_cache import ConversionCache
+
+def test_large_entry_spills_to_disk_tier(tmp_path):
+    cache = ConversionCache(max_memory_bytes=1000, disk_dir=str(tmp_path / 'cache'), max_disk_bytes=10 ** 6)
+    entry_writer = cache.entry_writer('big')
+    for _ in range(10):
+        entry_writer.write(b'x' * 500)
+        assert entry_writer._chunks is None or sum(map(len, entry_writer._chunks)) <= cache.max_memory_bytes
+    assert entry_writer.commit()
+    assert cache.stats()['memory_entries'] == 0 and cache.stats()['disk_entries'] == 1
+    assert cache.get('big') == b'x' * 5000
+    assert not list((tmp_path / 'cache').glob('*.tmp'))
+
+def test_entry_over_limits_is_dropped(tmp_path):
+    memory_only = ConversionCache(max_memory_bytes=1000)
+    entry_writer = memory_only.entry_writer('big')
+    entry_writer.write(b'x' * 1001)
+    assert not entry_writer.commit() and memory_only.get('big') is None
+
+    with_disk = ConversionCache(max_memory_bytes=1000, disk_dir=str(tmp_path / 'cache'), max_disk_bytes=2000)
+    entry_writer = with_disk.entry_writer('big')
+    entry_writer.write(b'x' * 1500)
+    entry_writer.write(b'x' * 1500)
+    assert not entry_writer.commit() and with_disk.get('big') is None
+    assert not list((tmp_path / 'cache').iterdir())
+
+def test_put_file_and_restart(tmp_path):
+    eml_path = tmp_path / 'out.eml'
+    eml_path.write_bytes(b'y' * 3000)
+    cache = ConversionCache(max_memory_bytes=1000, disk_dir=str(tmp_path / 'cache'))
+    assert cache.put_file('k', str(eml_path))
+    assert ConversionCache(disk_dir=str(tmp_path / 'cache')).get('k') == b'y' * 3000
+
+def test_conversion_is_cached(tmp_path, corpus_dir):
+    msg_path = str(corpus_dir / 'large_binary_attachments.msg')
+    cache = ConversionCache(max_memory_bytes=1024 * 1024, disk_dir=str(tmp_path / 'cache'))
+    first_output, second_output = BytesIO(), BytesIO()
+    msg_converter_core.convert_msg_to_eml_stream(msg_path, first_output, 'out', log_callback=None, cache=cache)
+    assert cache.stats()['disk_entries'] == 1 and cache.stats()['memory_entries'] == 0 # Larger than the memory tier
+    msg_converter_core.convert_msg_to_eml_stream(msg_path, second_output, 'out', log_callback=None, cache=cache)
+    assert cache.stats()['disk_hits'] == 1
+    assert first_output.getvalue() == second_output.getvalue()
@@ -0,0 +1,40 @@
+# tests/test_conversion_limits.py
+import io
+
+import pytest
+
+import msg_converter_core
+
+@pytest.mark.parametrize('limit, reason', [
+    ({'max_attachments': 3}, 'attachment_count'),
+    ({'max_attachment_bytes': 1024}, 'attachment_size'),
+])
+def test_limits_fail_before_attachments_are_loaded(monkeypatch, corpus_dir, limit, reason):
+    msg_instance = msg_converter_core.load_extract_msg().Message(str(corpus_dir / 'large_binary_attachments.msg'), delayAttachments=True)
+    try:
+        with pytest.raises(msg_converter_core.ConversionLimitExceeded) as raised:
+            msg_converter_core.check_attachment_limits(msg_instance, **limit)
+        assert raised.value.reason == reason
+        assert 'attachments' not in vars(msg_instance) # The cached property was never read
+    finally:
+        msg_instance.close()
+
+    def build_not_reached(*args, **kwargs):
+        raise AssertionError("attachments were loaded")
+    monkeypatch.setattr(msg_converter_core, 'build_eml_from_msg', build_not_reached)
+    events = []
+    result = msg_converter_core.convert_msg_to_eml_stream(str(corpus_dir / 'large_binary_attachments.msg'), io.BytesIO(), 'large',
+                                                         log_callback=None, metrics_callback=events.append, **limit)
+    assert result == (None, None)
+    assert events[-1]['limit'] == reason
+
+def test_nested_attachments_count_towards_the_limits(corpus_dir):
+    msg_instance = msg_converter_core.load_extract_msg().Message(str(corpus_dir / 'deep_nesting.msg'), delayAttachments=True)
+    try:
+        msg_converter_core.check_attachment_limits(msg_instance, max_attachments=5, max_nesting_depth=2)
+        with pytest.raises(msg_converter_core.AttachmentCountExceeded):
+            msg_converter_core.check_attachment_limits(msg_instance, max_attachments=4)
+        with pytest.raises(msg_converter_core.NestingDepthExceeded):
+            msg_converter_core.check_attachment_limits(msg_instance, max_nesting_depth=1)
+    finally:
+        msg_instance.close()
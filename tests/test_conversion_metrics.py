@@ -0,0 +1,27 @@
+# tests/test_conversion_metrics.py
+import io
+
+import msg_converter_core
+from conversion_metrics import ConversionMetrics
+
+TOP_LEVEL_STAGES = ('ole_parse', 'attachment_load', 'headers', 'body', 'attachment', 'nested_message', 'serialize')
+
+def convert_with_metrics(msg_path):
+    metrics = ConversionMetrics()
+    bytes_written, _ = msg_converter_core.convert_msg_to_eml_stream(msg_path, io.BytesIO(), 'x', log_callback=None, metrics_callback=metrics)
+    assert bytes_written is not None
+    return metrics
+
+def test_attachment_load_is_timed(corpus_dir):
+    metrics = convert_with_metrics(str(corpus_dir / 'large_binary_attachments.msg'))
+    totals = metrics.stage_totals()
+    assert totals['attachment_load']['count'] == 1
+    assert totals['attachment_load']['bytes'] == totals['attachment']['bytes']
+    top_level_seconds = sum(event['seconds'] for event in metrics.events
+                            if event['stage'] in TOP_LEVEL_STAGES and event.get('nesting_level', 0) == 0)
+    assert top_level_seconds >= 0.9 * metrics.total_seconds() # Nothing big is left unattributed
+
+def test_nested_messages_load_their_own_attachments(corpus_dir):
+    metrics = convert_with_metrics(str(corpus_dir / 'deep_nesting.msg'))
+    load_levels = [event['nesting_level'] for event in metrics.events if event['stage'] == 'attachment_load']
+    assert load_levels == [0, 1, 2]
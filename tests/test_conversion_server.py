@@ -0,0 +1,145 @@
+# tests/test_conversion_server.py
+# Runs ConversionServer in-process on a thread pool and talks to it with the module's own client.
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import conversion_guard
+import conversion_server
+import msg_converter_core
+
+def run_with_server(scenario, **server_options):
+    # Starts a server on a free port, runs `await scenario(server)` and shuts the server down again
+    async def main():
+        executor = ThreadPoolExecutor(max_workers=2)
+        server = conversion_server.ConversionServer(port=0, executor=executor, **server_options)
+        await server.start()
+        try:
+            return await scenario(server)
+        finally:
+            await server.close()
+            executor.shutdown(wait=True)
+    return asyncio.run(main())
+
+def post(server, msg_bytes, filename='upload.msg'):
+    return conversion_server.post_msg(server.host, server.port, msg_bytes, filename)
+
+@pytest.fixture
+def msg_bytes(corpus_dir):
+    return (corpus_dir / 'forwarded_duplicates.msg').read_bytes()
+
+def test_converts_raw_upload(msg_bytes):
+    async def scenario(server):
+        return await post(server, msg_bytes, 'Re: a b.msg'), server.health()
+    (status, headers, body), health = run_with_server(scenario)
+    assert status == 200
+    assert headers['content-disposition'] == 'attachment; filename="Re_a_b.eml"'
+    expected_eml, _ = msg_converter_core.convert_msg_to_single_eml(msg_bytes, 'x', log_callback=None)
+    assert len(body) == len(expected_eml) # Same EML apart from the random boundaries
+    assert body.split(b'\n', 1)[0] == expected_eml.split(b'\n', 1)[0]
+    assert health['converted'] == 1 and health['in_flight'] == 0
+
+def test_converts_multipart_upload(msg_bytes):
+    form_body = (b'--XyZ\r\nContent-Disposition: form-data; name="file"; filename="mail.msg"\r\n'
+                 b'Content-Type: application/octet-stream\r\n\r\n' + msg_bytes + b'\r\n--XyZ--\r\n')
+    async def scenario(server):
+        return await conversion_server.send_request(server.host, server.port, 'POST', '/convert', form_body,
+                                                    {'Content-Type': 'multipart/form-data; boundary=XyZ'})
+    status, headers, body = run_with_server(scenario)
+    assert status == 200 and headers['content-disposition'] == 'attachment; filename="mail.eml"'
+
+@pytest.mark.parametrize('filename, expected', [
+    ('Отчёт.msg', "attachment; filename=\"_____.eml\"; filename*=UTF-8''%D0%9E%D1%82%D1%87%D1%91%D1%82.eml"),
+    ('a\u2019b.msg', "attachment; filename=\"a_b.eml\"; filename*=UTF-8''a%E2%80%99b.eml"),
+], ids=['cyrillic', 'curly_quote'])
+def test_non_ascii_filenames(msg_bytes, filename, expected):
+    form_body = (b'--XyZ\r\nContent-Disposition: form-data; name="file"; filename="' + filename.encode('utf-8') + b'"\r\n'
+                 b'Content-Type: application/octet-stream\r\n\r\n' + msg_bytes + b'\r\n--XyZ--\r\n')
+    async def scenario(server):
+        raw_response = await post(server, msg_bytes, filename)
+        multipart_response = await conversion_server.send_request(server.host, server.port, 'POST', '/convert', form_body,
+                                                                  {'Content-Type': 'multipart/form-data; boundary=XyZ'})
+        return raw_response, multipart_response
+    for status, headers, body in run_with_server(scenario):
+        assert status == 200
+        assert headers['content-disposition'] == expected
+
+def test_unexpected_server_error_gets_500(monkeypatch, msg_bytes):
+    def broken_stream_file(*args):
+        raise RuntimeError("bug")
+    async def scenario(server):
+        monkeypatch.setattr(server, '_stream_file', broken_stream_file)
+        return await post(server, msg_bytes)
+    status, headers, body = run_with_server(scenario)
+    assert status == 500 and b'RuntimeError' in body
+
+def test_invalid_msg_gets_422():
+    async def scenario(server):
+        return await post(server, b'not an msg file' * 100)
+    status, headers, body = run_with_server(scenario)
+    assert status == 422 and b'Error reading main MSG file' in body
+    assert 'x-conversion-limit' not in headers
+
+def test_limit_gets_422_with_header(msg_bytes):
+    async def scenario(server):
+        response = await post(server, msg_bytes)
+        return response, server.health()
+    (status, headers, body), health = run_with_server(scenario, limits=conversion_guard.ConversionLimits(max_attachments=2))
+    assert status == 422 and headers['x-conversion-limit'] == 'attachment_count'
+    assert health['failed'] == 1 and health['over_limit'] == 1
+
+def test_worker_failures(monkeypatch, msg_bytes):
+    def stopped_worker(*args):
+        raise conversion_guard.WorkerFailed('timeout', "Conversion did not finish within 1s; its worker was stopped.")
+    monkeypatch.setattr(conversion_server, 'convert_upload', stopped_worker)
+    status, headers, _ = run_with_server(lambda server: post(server, msg_bytes))
+    assert status == 422 and headers['x-conversion-limit'] == 'timeout'
+
+    def no_worker(*args):
+        raise conversion_guard.WorkerFailed('startup', "The worker process exited before it was ready.")
+    monkeypatch.setattr(conversion_server, 'convert_upload', no_worker)
+    status, headers, _ = run_with_server(lambda server: post(server, msg_bytes))
+    assert status == 503 and headers['retry-after'] == '5'
+
+def test_converter_exception_gets_500(monkeypatch, msg_bytes):
+    calls = []
+    convert_msg_to_eml_stream = msg_converter_core.convert_msg_to_eml_stream
+    def fail_once(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("converter bug")
+        return convert_msg_to_eml_stream(*args, **kwargs)
+    monkeypatch.setattr(msg_converter_core, 'convert_msg_to_eml_stream', fail_once)
+    async def scenario(server):
+        return await post(server, msg_bytes), await post(server, msg_bytes), server.health()
+    (status, _, body), (next_status, _, _), health = run_with_server(scenario)
+    assert status == 500 and b'converter bug' in body
+    assert next_status == 200 # The server keeps going
+    assert health['failed'] == 1 and health['converted'] == 1
+
+def test_busy_and_shutting_down(monkeypatch, msg_bytes):
+    release = threading.Event()
+    started = threading.Event()
+    def blocked_conversion(*args):
+        started.set()
+        release.wait(10)
+        return None, None, "Released.", None
+    monkeypatch.setattr(conversion_server, 'convert_upload', blocked_conversion)
+    async def scenario(server):
+        first_request = asyncio.ensure_future(post(server, msg_bytes))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 10)
+        busy_response = await post(server, msg_bytes)
+        release.set()
+        first_response = await first_request
+        server._accepting = False # As during close(), before the listener is gone
+        closing_response = await post(server, msg_bytes)
+        health = await conversion_server.send_request(server.host, server.port, 'GET', '/healthz')
+        return busy_response, first_response, closing_response, json.loads(health[2])
+    busy_response, first_response, closing_response, health = run_with_server(scenario, workers=1, queue_limit=0)
+    assert busy_response[0] == 429 and busy_response[1]['retry-after'] == '1'
+    assert first_response[0] == 422
+    assert closing_response[0] == 503
+    assert health['rejected_busy'] == 1 and health['rejected_unavailable'] == 1 and health['status'] == 'shutting_down'
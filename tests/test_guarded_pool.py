@@ -0,0 +1,15 @@
+# tests/test_guarded_pool.py
+import pytest
+
+import conversion_guard
+
+def test_worker_that_cannot_be_started_fails_its_task(monkeypatch):
+    def no_process(*args, **kwargs):
+        raise OSError("Resource temporarily unavailable")
+    monkeypatch.setattr(conversion_guard, '_WorkerProcess', no_process)
+    with conversion_guard.GuardedPool(max_workers=2) as pool:
+        futures = [pool.submit(len, 'abc') for _ in range(3)]
+        for future in futures:
+            with pytest.raises(conversion_guard.WorkerFailed) as raised:
+                future.result(timeout=10)
+            assert raised.value.reason == 'startup'
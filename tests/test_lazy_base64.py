@@ -0,0 +1,29 @@
+# tests/test_lazy_base64.py
+import base64
+
+import msg_converter_core
+from msg_converter_core import LazyBase64Part
+
+def build_eml(msg_path):
+    msg_instance = msg_converter_core.load_extract_msg().Message(msg_path)
+    try:
+        return msg_converter_core.build_eml_from_msg(msg_instance, log_callback=None)
+    finally:
+        msg_instance.close()
+
+def test_walk_does_not_encode_attachments(monkeypatch, scenario_msg):
+    eml_obj = build_eml(scenario_msg)
+    def fail_on_encode(self, chunk_size=None):
+        raise AssertionError(f"{self.get_filename()} was encoded")
+    monkeypatch.setattr(LazyBase64Part, 'iter_encoded_chunks', fail_on_encode)
+    lazy_parts = [part for part in eml_obj.walk() if isinstance(part, LazyBase64Part)]
+    assert all(part.raw_size() > 0 for part in lazy_parts)
+
+def test_payload_still_available_on_request():
+    raw_data = bytes(range(256)) * 1000
+    part = LazyBase64Part('application', 'octet-stream', raw_data)
+    assert not part.is_multipart()
+    assert part.get_payload() == base64.encodebytes(raw_data).decode('ascii')
+    assert part.get_payload(decode=True) == raw_data
+    part.set_payload('replaced')
+    assert part.get_payload() == 'replaced' and not part.is_multipart()
@@ -0,0 +1,78 @@
+# tests/test_mbox_output.py
+import gzip
+import mailbox
+import re
+import shutil
+
+import pytest
+
+import batch_convert
+import msg_converter_core
+
+def make_input_dir(tmp_path, corpus_dir, names):
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    for name in names:
+        shutil.copy(str(corpus_dir / f"{name}.msg"), str(input_dir / f"{name}.msg"))
+    return input_dir
+
+def fail_halfway(monkeypatch, failures):
+    # The first `failures` conversions write part of a message, then fail
+    write_eml_message = msg_converter_core.write_eml_message
+    calls = []
+    def write_or_fail(eml_message_obj, output_fp, **kwargs):
+        calls.append(output_fp)
+        if len(calls) <= failures:
+            output_fp.write(b'Subject: partial\n\nFrom the middle\n' + b'x' * 1000)
+            raise OSError("disk full")
+        return write_eml_message(eml_message_obj, output_fp, **kwargs)
+    monkeypatch.setattr(msg_converter_core, 'write_eml_message', write_or_fail)
+
+def read_mbox(mbox_path, tmp_path):
+    if mbox_path.suffix == '.gz':
+        plain_path = tmp_path / 'plain.mbox'
+        with gzip.open(str(mbox_path), 'rb') as compressed, open(str(plain_path), 'wb') as plain:
+            shutil.copyfileobj(compressed, plain)
+        mbox_path = plain_path
+    return mbox_path.read_bytes(), [message['Subject'] for message in mailbox.mbox(str(mbox_path))]
+
+@pytest.mark.parametrize('mbox_name', ['out.mbox', 'out.mbox.gz'])
+def test_failed_conversion_leaves_no_partial_message(monkeypatch, tmp_path, corpus_dir, mbox_name):
+    input_dir = make_input_dir(tmp_path, corpus_dir, ('deep_nesting', 'html_and_plain'))
+    fail_halfway(monkeypatch, failures=1)
+    def no_temp_dir(*args, **kwargs):
+        raise AssertionError("-j 1 streams into the mbox without temp files")
+    monkeypatch.setattr(batch_convert.tempfile, 'mkdtemp', no_temp_dir)
+    mbox_path = tmp_path / mbox_name
+    results, summary = batch_convert.convert_directory_to_mbox(str(input_dir), str(mbox_path), jobs=1, log_callback=lambda message: None)
+    assert [result['status'] for result in results] == ['failed', 'converted']
+    assert summary['failed'] == 1
+    mbox_bytes, subjects = read_mbox(mbox_path, tmp_path)
+    assert subjects == ['=?utf-8?q?HTML_and_plain_bodies?=']
+    assert b'partial' not in mbox_bytes
+    assert not [path for path in tmp_path.iterdir() if path.name.startswith('.')] # Temp files are gone
+
+def test_retry_after_a_failure_appends_the_message_once(monkeypatch, tmp_path, corpus_dir):
+    input_dir = make_input_dir(tmp_path, corpus_dir, ('html_and_plain',))
+    fail_halfway(monkeypatch, failures=1)
+    mbox_path = tmp_path / 'out.mbox'
+    results, _ = batch_convert.convert_directory_to_mbox(str(input_dir), str(mbox_path), jobs=1, retries=1, log_callback=lambda message: None)
+    assert results[0]['status'] == 'converted' and results[0]['attempts'] == 2
+    mbox_bytes, subjects = read_mbox(mbox_path, tmp_path)
+    assert subjects == ['=?utf-8?q?HTML_and_plain_bodies?=']
+    assert mbox_bytes.count(b'\nFrom MAILER-DAEMON ') == 0 and mbox_bytes.startswith(b'From MAILER-DAEMON ')
+
+@pytest.mark.parametrize('mbox_name', ['out.mbox', 'out.mbox.gz'])
+def test_streamed_and_worker_archives_match(tmp_path, corpus_dir, mbox_name):
+    input_dir = make_input_dir(tmp_path, corpus_dir, ('deep_nesting', 'html_and_plain', 'many_recipients'))
+    archives = []
+    for jobs in (1, 2):
+        mbox_path = tmp_path / f"j{jobs}-{mbox_name}"
+        batch_convert.convert_directory_to_mbox(str(input_dir), str(mbox_path), jobs=jobs, log_callback=lambda message: None)
+        archives.append(mask_run_details(read_mbox(mbox_path, tmp_path)[0]))
+    assert archives[0] == archives[1]
+
+def mask_run_details(mbox_bytes):
+    # Separator dates and MIME boundaries differ between runs
+    mbox_bytes = re.sub(rb'^From MAILER-DAEMON .*$', b'From MAILER-DAEMON', mbox_bytes, flags=re.MULTILINE)
+    return re.sub(rb'===============\d+==', b'=====BOUNDARY==', mbox_bytes)
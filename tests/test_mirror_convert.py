@@ -0,0 +1,17 @@
+# tests/test_mirror_convert.py
+import os
+import shutil
+
+import mirror_convert
+
+def test_colliding_sources_keep_their_own_outputs(tmp_path, corpus_dir):
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    shutil.copy(str(corpus_dir / 'html_and_plain.msg'), str(input_dir / 'a b.msg'))
+    shutil.copy(str(corpus_dir / 'many_recipients.msg'), str(input_dir / 'a_b.msg'))
+    output_dir = tmp_path / 'out'
+    _, summary = mirror_convert.mirror_directory(str(input_dir), str(output_dir), jobs=1, log_callback=lambda message: None)
+    assert summary['converted'] == 2
+    assert sorted(name for name in os.listdir(str(output_dir)) if name.endswith('.eml')) == ['a_b (2).eml', 'a_b.eml']
+    _, summary = mirror_convert.mirror_directory(str(input_dir), str(output_dir), jobs=1, log_callback=lambda message: None)
+    assert summary['unchanged'] == 2
@@ -0,0 +1,37 @@
+# tests/test_quarantine.py
+import pytest
+
+from conversion_guard import ConversionLimits, Quarantine
+
+@pytest.fixture
+def msg_file(tmp_path):
+    path = tmp_path / 'big.msg'
+    path.write_bytes(b'not really an MSG')
+    return str(path)
+
+def test_limit_entry_applies_only_while_the_limit_is_as_strict(tmp_path, msg_file):
+    quarantine_path = str(tmp_path / 'quarantine.jsonl')
+    Quarantine(quarantine_path, ConversionLimits(max_attachments=10)).add(msg_file, 'attachment_count', "too many")
+    assert Quarantine(quarantine_path, ConversionLimits(max_attachments=10)).get(msg_file)['reason'] == 'attachment_count'
+    assert Quarantine(quarantine_path, ConversionLimits(max_attachments=5)).get(msg_file) is not None
+    assert Quarantine(quarantine_path, ConversionLimits(max_attachments=50)).get(msg_file) is None
+    assert Quarantine(quarantine_path, ConversionLimits()).get(msg_file) is None
+    assert Quarantine(quarantine_path).get(msg_file) is None
+
+def test_timeout_entry_applies_after_a_repeat_failure(tmp_path, msg_file):
+    quarantine_path = str(tmp_path / 'quarantine.jsonl')
+    limits = ConversionLimits(timeout=60)
+    Quarantine(quarantine_path, limits).add(msg_file, 'timeout', "timed out")
+    quarantine = Quarantine(quarantine_path, limits)
+    assert quarantine.get(msg_file) is None
+    quarantine.add(msg_file, 'timeout', "timed out")
+    assert Quarantine(quarantine_path, limits).get(msg_file)['failures'] == 2
+    assert Quarantine(quarantine_path, ConversionLimits(timeout=600)).get(msg_file) is None
+
+def test_changed_file_is_tried_again(tmp_path, msg_file):
+    quarantine_path = str(tmp_path / 'quarantine.jsonl')
+    limits = ConversionLimits(max_attachment_bytes=1024)
+    Quarantine(quarantine_path, limits).add(msg_file, 'attachment_size', "too big")
+    with open(msg_file, 'ab') as f:
+        f.write(b're-exported')
+    assert Quarantine(quarantine_path, limits).get(msg_file) is None
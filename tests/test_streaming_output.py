@@ -0,0 +1,39 @@
+# tests/test_streaming_output.py
+# The streamed EML must stay byte-identical to what the stdlib generator (as_bytes()) produces
+# for the same EML object; multipart boundaries are random per run, so they are masked.
+import re
+from io import BytesIO
+
+import pytest
+
+import msg_converter_core
+
+BOUNDARY_PATTERN = re.compile(rb'===============\d+==')
+
+def mask_boundaries(eml_bytes):
+    # Numbers boundaries by first appearance, so a mixed-up nesting still shows as a difference
+    seen = {}
+    return BOUNDARY_PATTERN.sub(lambda m: seen.setdefault(m.group(0), b'BOUNDARY-%d' % len(seen)), eml_bytes)
+
+def baseline_eml_bytes(msg_path):
+    msg_instance = msg_converter_core.load_extract_msg().Message(msg_path)
+    try:
+        return msg_converter_core.build_eml_from_msg(msg_instance, log_callback=None).as_bytes()
+    finally:
+        msg_instance.close()
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'blob_store': msg_converter_core.AttachmentBlobStore(max_bytes=1024 * 1024)}, # Small enough to evict
+], ids=['serial', 'shared_blob_store'])
+def test_stream_matches_as_bytes(scenario_msg, options):
+    output = BytesIO()
+    bytes_written, _ = msg_converter_core.convert_msg_to_eml_stream(scenario_msg, output, 'out', log_callback=None, **options)
+    assert bytes_written == len(output.getvalue())
+    assert mask_boundaries(output.getvalue()) == mask_boundaries(baseline_eml_bytes(scenario_msg))
+
+def test_stream_to_path_matches_single_eml(tmp_path, scenario_msg):
+    eml_path = tmp_path / 'out.eml'
+    msg_converter_core.convert_msg_to_eml_stream(scenario_msg, str(eml_path), 'out', log_callback=None)
+    eml_bytes, _ = msg_converter_core.convert_msg_to_single_eml(scenario_msg, 'out', log_callback=None)
+    assert mask_boundaries(eml_path.read_bytes()) == mask_boundaries(eml_bytes)